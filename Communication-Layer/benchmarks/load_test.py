@@ -0,0 +1,338 @@
+# benchmarks/load_test.py
+# End-to-end load test of comm_service's /ws/chat/{phone_number} with local
+# stand-ins for MongoDB, the AI service and the agentic core (see stand_ins.py).
+#
+# Three processes: the stand-ins, the real comm_service app (with an in-memory
+# farmer store and per-stage timers patched in), and this driver, which runs N
+# simulated farmers through greeting -> question -> agent replies. Reports
+# throughput, p50/p95/p99 per stage, and event-loop lag in comm_service and in
+# the driver (if the driver lags, the numbers are measuring the driver).
+#
+#   python load_test.py --farmers 500 --concurrency 100 --sessions 2000
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import uvicorn
+import websockets
+
+from stand_ins import AGENT_SCRIPT, InMemoryFarmerCollection, InMemoryInteractionCollection, create_agent_service, \
+    create_ai_service, generate_farmers, phone_number
+
+COMM_SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "comm_service")
+HOST = "127.0.0.1"
+QUESTIONS = [
+    "When should I sow wheat this season?",
+    "My soybean leaves are turning yellow, what should I do?",
+    "What is the mandi price for onions in Nashik?",
+    "Will it rain in the next three days?",
+]
+
+
+# --- Measurement ---
+class StageRecorder:
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+
+class LagMonitor:
+    """Measures how late the event loop wakes up from a short sleep."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": (values[-1] * 1000) if values else 0.0,
+    }
+
+
+# --- Service processes ---
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def run_stand_ins(ai_port, agent_port, options):
+    ai_app = create_ai_service(options["translate_latency"], options["per_text_latency"],
+                               options["stt_latency"], options["jitter"])
+    agent_app = create_agent_service(options["agent_delays"], options["jitter"])
+    servers = [
+        uvicorn.Server(uvicorn.Config(ai_app, host=HOST, port=ai_port, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(agent_app, host=HOST, port=agent_port, log_level="warning")),
+    ]
+
+    async def serve():
+        await asyncio.gather(*(server.serve() for server in servers))
+
+    asyncio.run(serve())
+
+
+def run_comm_service(port, ai_port, agent_port, options, stats_path):
+    """Runs the real comm_service app against the stand-ins, timing each stage."""
+    os.environ["STT_TTS_SERVICE_URL"] = f"http://{HOST}:{ai_port}"
+    os.environ["AGENTIC_CORE_WEBSOCKET_URL"] = f"ws://{HOST}:{agent_port}/ws"
+    sys.path.insert(0, COMM_SERVICE_DIR)
+    import main
+    from interaction_log import InteractionLogWriter
+    from profiles import FarmerProfileCache
+
+    recorder = StageRecorder()
+    lag = LagMonitor()
+    collection = InMemoryFarmerCollection(generate_farmers(options["farmers"]), latency=options["db_latency"])
+    main.profile_cache = FarmerProfileCache(collection)
+    interactions = InMemoryInteractionCollection(latency=options["log_latency"])
+    main.interaction_log = InteractionLogWriter(
+        interactions, spill_path=os.path.join(os.path.dirname(stats_path), "interaction-log.spill.jsonl")
+    )
+
+    cache_get = main.profile_cache.get
+    process_text = main.process_text
+    process_texts = main.process_texts
+
+    async def timed_profile_lookup(farmer_id):
+        with recorder.time("profile_lookup"):
+            return await cache_get(farmer_id)
+
+    async def timed_process_text(payload):
+        if payload.get("media_url"):
+            stage = "stt_to_english"
+        elif "NANDI assistant" in payload.get("text", ""):
+            stage = "greeting_translation"
+        else:
+            stage = "translate_to_english"
+        with recorder.time(stage):
+            return await process_text(payload)
+
+    async def timed_process_texts(texts, source_lang, target_lang):
+        with recorder.time("translate_to_user"):
+            return await process_texts(texts, source_lang, target_lang)
+
+    main.profile_cache.get = timed_profile_lookup
+    main.process_text = timed_process_text
+    main.process_texts = timed_process_texts
+
+    @main.app.on_event("startup")
+    async def start_lag_monitor():
+        lag.start()
+
+    @main.app.on_event("shutdown")
+    async def write_stats():
+        lag.stop()
+        with open(stats_path, "w", encoding="utf-8") as f:
+            json.dump({"stages": recorder.samples, "lag": lag.samples, "interaction_log": main.interaction_log.stats()}, f)
+
+    if options["quiet"]:
+        logging.getLogger().setLevel(logging.WARNING)
+    uvicorn.run(main.app, host=HOST, port=port, log_level="warning")
+
+
+async def wait_for_port(port, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(HOST, port)
+            writer.close()
+            return
+        except OSError:
+            if not process.is_alive():
+                raise RuntimeError(f"Process for port {port} exited with code {process.exitcode}.")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Nothing listening on port {port} after {timeout}s.")
+            await asyncio.sleep(0.1)
+
+
+# --- Driver ---
+async def simulate_session(session_index, comm_port, options, recorder):
+    """One farmer: connect, get the greeting, ask a question, read every agent reply."""
+    farmer_number = phone_number(session_index % options["farmers"])
+    url = f"ws://{HOST}:{comm_port}/ws/chat/{farmer_number}"
+    started = time.perf_counter()
+    replies = 0
+    async with websockets.connect(url, max_size=None) as ws:
+        await asyncio.wait_for(ws.recv(), options["timeout"])
+        recorder.add("connect_to_greeting", time.perf_counter() - started)
+
+        asked = time.perf_counter()
+        await ws.send(json.dumps({"type": "text", "message": random.choice(QUESTIONS)}))
+        last = asked
+        while replies < len(AGENT_SCRIPT):
+            await asyncio.wait_for(ws.recv(), options["timeout"])
+            now = time.perf_counter()
+            recorder.add("question_to_first_reply" if replies == 0 else "between_replies", now - last)
+            last = now
+            replies += 1
+    recorder.add("session", time.perf_counter() - started)
+    return replies
+
+
+async def drive(comm_port, options):
+    recorder = StageRecorder()
+    lag = LagMonitor()
+    lag.start()
+    limit = asyncio.Semaphore(options["concurrency"])
+    failures = {}
+    replies_received = 0
+    ramp_step = options["ramp_up"] / max(1, options["sessions"])
+
+    async def one(session_index):
+        nonlocal replies_received
+        await asyncio.sleep(session_index * ramp_step)
+        async with limit:
+            try:
+                replies = await simulate_session(session_index, comm_port, options, recorder)
+                replies_received += replies
+            except Exception as e:
+                kind = type(e).__name__
+                failures[kind] = failures.get(kind, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(options["sessions"])))
+    elapsed = time.perf_counter() - started
+    lag.stop()
+    return recorder, lag, failures, replies_received, elapsed
+
+
+def print_table(title, stages):
+    print(f"\n{title}")
+    print(f"  {'stage':<26}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, summary in stages.items():
+        print(f"  {stage:<26}{summary['count']:>8}{summary['p50_ms']:>10.1f}{summary['p95_ms']:>10.1f}"
+              f"{summary['p99_ms']:>10.1f}{summary['max_ms']:>10.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load-test comm_service with local stand-ins.")
+    parser.add_argument("--farmers", type=int, default=200, help="distinct farmer profiles")
+    parser.add_argument("--sessions", type=int, default=500, help="chat sessions to run in total")
+    parser.add_argument("--concurrency", type=int, default=50, help="sessions open at the same time")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which sessions start")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-message receive timeout")
+    parser.add_argument("--translate-latency", type=float, default=0.05, help="AI service seconds per call")
+    parser.add_argument("--per-text-latency", type=float, default=0.01, help="extra seconds per batched text")
+    parser.add_argument("--stt-latency", type=float, default=0.3, help="AI service seconds per audio message")
+    parser.add_argument("--agent-delays", type=float, nargs="*", default=[0.2, 0.3, 0.4],
+                        help="seconds between the scripted agent replies")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="seconds per farmer lookup")
+    parser.add_argument("--log-latency", type=float, default=0.01, help="seconds per interaction-log batch insert")
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction applied to every latency")
+    parser.add_argument("--json", help="also write the full report to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep comm_service's INFO logs")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    options = {
+        "farmers": args.farmers, "sessions": args.sessions, "concurrency": args.concurrency,
+        "ramp_up": args.ramp_up, "timeout": args.timeout, "translate_latency": args.translate_latency,
+        "per_text_latency": args.per_text_latency, "stt_latency": args.stt_latency,
+        "agent_delays": args.agent_delays, "db_latency": args.db_latency, "log_latency": args.log_latency,
+        "jitter": args.jitter,
+        "quiet": not args.verbose,
+    }
+    ai_port, agent_port, comm_port = free_port(), free_port(), free_port()
+    stats_path = os.path.join(tempfile.mkdtemp(prefix="nandi-bench-"), "comm_service.json")
+
+    context = multiprocessing.get_context("spawn")
+    stand_ins = context.Process(target=run_stand_ins, args=(ai_port, agent_port, options), daemon=True)
+    comm = context.Process(target=run_comm_service, args=(comm_port, ai_port, agent_port, options, stats_path))
+    stand_ins.start()
+    try:
+        asyncio.run(wait_for_port(ai_port, stand_ins))
+        asyncio.run(wait_for_port(agent_port, stand_ins))
+        comm.start()
+        asyncio.run(wait_for_port(comm_port, comm))
+
+        print(f"Running {args.sessions} sessions over {args.farmers} farmers, {args.concurrency} at a time...")
+        recorder, driver_lag, failures, replies, elapsed = asyncio.run(drive(comm_port, options))
+    finally:
+        if comm.is_alive():
+            comm.terminate()  # SIGTERM: uvicorn shuts down gracefully and the stats get written.
+            comm.join(timeout=15)
+        stand_ins.kill()  # Two servers share one process, so only one of them would see SIGTERM.
+        stand_ins.join(timeout=5)
+
+    with open(stats_path, "r", encoding="utf-8") as f:
+        server = json.load(f)
+
+    completed = len(recorder.samples.get("session", []))
+    report = {
+        "sessions": {"requested": args.sessions, "completed": completed, "failed": failures},
+        "elapsed_seconds": elapsed,
+        "throughput": {"sessions_per_second": completed / elapsed, "agent_messages_per_second": replies / elapsed},
+        "client_stages": {stage: summarize(values) for stage, values in recorder.samples.items()},
+        "server_stages": {stage: summarize(values) for stage, values in server["stages"].items()},
+        "event_loop_lag": {"comm_service": summarize(server["lag"]), "driver": summarize(driver_lag.samples)},
+        "interaction_log": server["interaction_log"],
+    }
+
+    print(f"\nCompleted {completed}/{args.sessions} sessions in {elapsed:.1f}s "
+          f"({report['throughput']['sessions_per_second']:.1f} sessions/s, "
+          f"{report['throughput']['agent_messages_per_second']:.1f} agent messages/s).")
+    if failures:
+        print(f"Failures: {failures}")
+    print_table("End to end (measured by the simulated farmers)", report["client_stages"])
+    print_table("Inside comm_service", report["server_stages"])
+    print_table("Event-loop lag", report["event_loop_lag"])
+    print(f"\nInteraction log: {report['interaction_log']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nFull report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# benchmarks/stand_ins.py
+# Lightweight stand-ins for the services comm_service depends on, so the chat
+# path can be load-tested without MongoDB, GPUs or models:
+#   - an in-memory farmer collection (find_one / find with $in, like pymongo)
+#   - an in-memory interaction-log collection (insert_many with per-batch latency)
+#   - a fake AI service: /process with configurable latency per call and per text
+#   - a scripted agent socket like agentic_core's mock, with configurable delays
+
+import asyncio
+import json
+import random
+import time
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+from typing import List, Optional
+
+LANGUAGES = ["Hindi", "Marathi", "Tamil", "English"]
+FIRST_NAMES = ["Ramesh", "Sita", "Arjun", "Lakshmi", "Vijay", "Priya", "Suresh", "Meena"]
+LAST_NAMES = ["Patil", "Kumar", "Devi", "Reddy", "Singh", "Iyer", "Pawar", "Yadav"]
+
+# Same shape as agentic_core's mock: an acknowledgement, two updates, a sign-off.
+AGENT_SCRIPT = [
+    "Okay, I've received your query about '{query}'. Let me check.",
+    "Based on the latest forecast, we expect light rain tomorrow.",
+    "The current market price for your main crop is stable. Is there anything else I can help with?",
+    "Thank you for using NANDI.",
+]
+
+
+def phone_number(i):
+    return f"91{9000000000 + i}"
+
+
+def generate_farmers(count, seed=7):
+    rng = random.Random(seed)
+    farmers = []
+    for i in range(count):
+        farmers.append({
+            "_id": f"+{phone_number(i)}",
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "primary_language": rng.choice(LANGUAGES),
+            "secondary_language": "English",
+        })
+    return farmers
+
+
+class InMemoryFarmerCollection:
+    """The subset of pymongo's Collection API that FarmerProfileCache uses."""
+
+    def __init__(self, farmers, latency=0.0):
+        self._farmers = {farmer["_id"]: farmer for farmer in farmers}
+        self.latency = latency
+
+    @staticmethod
+    def _project(farmer, projection):
+        if projection is None:
+            return dict(farmer)
+        return {key: value for key, value in farmer.items() if key == "_id" or projection.get(key)}
+
+    def find_one(self, filter, projection=None):
+        if self.latency:
+            time.sleep(self.latency)  # Runs on the cache's executor, like the real driver.
+        farmer = self._farmers.get(filter["_id"])
+        return self._project(farmer, projection) if farmer else None
+
+    def find(self, filter, projection=None):
+        ids = filter["_id"]["$in"]
+        return [self._project(self._farmers[i], projection) for i in ids if i in self._farmers]
+
+
+class InMemoryInteractionCollection:
+    """The subset of pymongo's Collection API that InteractionLogWriter uses."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.documents = []
+        self.batches = 0
+
+    def create_index(self, keys, **kwargs):
+        return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+    def insert_many(self, documents, ordered=True):
+        if self.latency:
+            time.sleep(self.latency)
+        self.documents.extend(documents)
+        self.batches += 1
+
+
+class _Latency:
+    def __init__(self, base, per_item, jitter):
+        self.base = base
+        self.per_item = per_item
+        self.jitter = jitter
+
+    async def wait(self, items=1):
+        delay = self.base + self.per_item * items
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        await asyncio.sleep(max(0.0, delay))
+
+
+class _ProcessRequest(BaseModel):
+    text: str = None
+    texts: List[str] = None
+    media_url: Optional[str] = None
+    source_lang: str
+    target_lang: str
+
+
+def create_ai_service(translate_latency=0.05, per_text_latency=0.01, stt_latency=0.3, jitter=0.2):
+    """Fake stt_tts_service: echoes text tagged with the target language after a delay."""
+    app = FastAPI(title="AI service stand-in")
+    translate = _Latency(translate_latency, per_text_latency, jitter)
+    stt = _Latency(stt_latency, 0.0, jitter)
+
+    @app.post("/process")
+    async def process(request: _ProcessRequest):
+        if request.texts is not None:
+            await translate.wait(len(request.texts))
+            return {"result_texts": [f"[{request.target_lang}] {t}" for t in request.texts], "route": "stand-in"}
+        if request.media_url:
+            await stt.wait()
+            text = "transcribed audio"
+        else:
+            text = request.text
+        await translate.wait()
+        return {"result_text": f"[{request.target_lang}] {text}", "route": "stand-in"}
+
+    return app
+
+
+def create_agent_service(reply_delays=(0.2, 0.3, 0.4), jitter=0.2):
+    """Scripted agent: one query per socket, then the AGENT_SCRIPT replies, then close."""
+    app = FastAPI(title="Agentic core stand-in")
+    delays = list(reply_delays)
+
+    @app.websocket("/ws")
+    async def agent(websocket: WebSocket):
+        await websocket.accept()
+        try:
+            query = json.loads(await websocket.receive_text()).get("query", "")
+            for i, reply in enumerate(AGENT_SCRIPT):
+                await websocket.send_text(reply.format(query=query))
+                if i < len(delays):
+                    await asyncio.sleep(delays[i] * random.uniform(1 - jitter, 1 + jitter))
+        except WebSocketDisconnect:
+            return
+        await websocket.close()
+
+    return app
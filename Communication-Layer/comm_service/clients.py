@@ -0,0 +1,141 @@
+# comm_service/clients.py
+# Long-lived connections shared by every chat session: one pooled HTTP client
+# for the AI (STT/translation) service and a pool of pre-opened WebSocket
+# connections to the agentic core.
+
+import asyncio
+import logging
+import os
+import random
+from contextlib import asynccontextmanager
+
+import httpx
+import websockets
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+AI_HTTP_MAX_CONNECTIONS = int(os.environ.get("AI_HTTP_MAX_CONNECTIONS", "200"))
+AI_HTTP_MAX_KEEPALIVE = int(os.environ.get("AI_HTTP_MAX_KEEPALIVE", "50"))
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("AI_HTTP_KEEPALIVE_EXPIRY", "60"))
+AI_HTTP_CONNECT_TIMEOUT = float(os.environ.get("AI_HTTP_CONNECT_TIMEOUT", "5"))
+AI_HTTP_TIMEOUT = float(os.environ.get("AI_HTTP_TIMEOUT", "60"))
+# HTTP/2 multiplexes requests over a single connection; needs the `h2` package.
+AI_HTTP2 = os.environ.get("AI_HTTP2", "false").lower() == "true"
+AI_HTTP_RETRIES = int(os.environ.get("AI_HTTP_RETRIES", "2"))
+AI_HTTP_RETRY_BASE_DELAY = float(os.environ.get("AI_HTTP_RETRY_BASE_DELAY", "0.2"))
+
+AGENT_POOL_WARM_SIZE = int(os.environ.get("AGENT_POOL_WARM_SIZE", "8"))
+
+# Worth retrying: the service is restarting, overloaded, or shed the request.
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+def create_ai_client():
+    """Builds the shared keep-alive client for the AI service."""
+    return httpx.AsyncClient(
+        http2=AI_HTTP2,
+        limits=httpx.Limits(
+            max_connections=AI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=AI_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=AI_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(AI_HTTP_TIMEOUT, connect=AI_HTTP_CONNECT_TIMEOUT),
+    )
+
+
+async def post_with_retries(client, url, retries=AI_HTTP_RETRIES, base_delay=AI_HTTP_RETRY_BASE_DELAY, **kwargs):
+    """
+    POSTs with exponential backoff and full jitter on connection errors and
+    retryable status codes. Returns the last response (or raises the last error).
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = await client.post(url, **kwargs)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == retries:
+                return response
+            logger.warning(f"POST {url} returned {response.status_code}; retrying (attempt {attempt + 1}).")
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"POST {url} failed ({e!r}); retrying (attempt {attempt + 1}).")
+        await asyncio.sleep(random.uniform(0, base_delay * 2 ** attempt))
+
+
+class AgentConnectionPool:
+    """
+    Keeps a few WebSocket connections to the agentic core open ahead of time, so
+    a new chat session doesn't pay the TCP + WebSocket handshake.
+    The agentic core protocol is one conversation per socket, so each connection
+    is handed out once and closed when its session ends; the pool refills itself
+    in the background.
+    """
+
+    def __init__(self, url, warm_size=AGENT_POOL_WARM_SIZE):
+        self.url = url
+        self.warm_size = warm_size
+        self._idle = asyncio.Queue()
+        self._refill_task = None
+        self._closed = False
+        self.connections_opened = 0
+        self.warm_hits = 0
+        self.cold_connects = 0
+
+    async def start(self):
+        self._closed = False
+        self._schedule_refill()
+
+    async def close(self):
+        self._closed = True
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+        while not self._idle.empty():
+            await self._idle.get_nowait().close()
+
+    async def _connect(self):
+        connection = await websockets.connect(self.url)
+        self.connections_opened += 1
+        return connection
+
+    def _schedule_refill(self):
+        if self._closed or self.warm_size <= 0:
+            return
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.ensure_future(self._refill())
+
+    async def _refill(self):
+        while not self._closed and self._idle.qsize() < self.warm_size:
+            try:
+                self._idle.put_nowait(await self._connect())
+            except Exception as e:
+                logger.warning(f"Could not pre-open agentic core connection: {e}")
+                await asyncio.sleep(1 + random.random())
+
+    async def acquire(self):
+        """Returns an open connection, preferring a pre-warmed one."""
+        while not self._idle.empty():
+            connection = self._idle.get_nowait()
+            if connection.open:
+                self.warm_hits += 1
+                self._schedule_refill()
+                return connection
+        self.cold_connects += 1
+        self._schedule_refill()
+        return await self._connect()
+
+    @asynccontextmanager
+    async def session(self):
+        connection = await self.acquire()
+        try:
+            yield connection
+        finally:
+            await connection.close()
+
+    def stats(self):
+        return {
+            "idle": self._idle.qsize(),
+            "warm_size": self.warm_size,
+            "connections_opened": self.connections_opened,
+            "warm_hits": self.warm_hits,
+            "cold_connects": self.cold_connects,
+        }
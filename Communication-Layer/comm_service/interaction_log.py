@@ -0,0 +1,297 @@
+# comm_service/interaction_log.py
+# Write-behind persistence for the `interaction-log` collection.
+# The chat path only appends a record to a bounded in-memory queue; a background
+# task flushes the queue with unordered `insert_many` calls, whenever a batch
+# fills up or the flush interval passes. Failed batches are retried with
+# backoff. If MongoDB stays down or falls behind, records are either dropped
+# or spilled to a local JSON-lines file and replayed once it catches up, so a
+# slow database never slows a conversation.
+
+import asyncio
+import logging
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+INTERACTION_LOG_ENABLED = os.environ.get("INTERACTION_LOG_ENABLED", "true").lower() == "true"
+INTERACTION_LOG_QUEUE_SIZE = int(os.environ.get("INTERACTION_LOG_QUEUE_SIZE", "10000"))
+INTERACTION_LOG_BATCH_SIZE = int(os.environ.get("INTERACTION_LOG_BATCH_SIZE", "500"))
+INTERACTION_LOG_FLUSH_INTERVAL = float(os.environ.get("INTERACTION_LOG_FLUSH_INTERVAL", "1.0"))
+INTERACTION_LOG_RETRIES = int(os.environ.get("INTERACTION_LOG_RETRIES", "3"))
+INTERACTION_LOG_RETRY_BASE_DELAY = float(os.environ.get("INTERACTION_LOG_RETRY_BASE_DELAY", "0.5"))
+# What happens to records MongoDB can't take: "drop" them, or "spill" them to disk for replay.
+INTERACTION_LOG_OVERFLOW = os.environ.get("INTERACTION_LOG_OVERFLOW", "spill").lower()
+INTERACTION_LOG_SPILL_PATH = os.environ.get("INTERACTION_LOG_SPILL_PATH", "interaction-log.spill.jsonl")
+# Records older than this are removed by MongoDB's TTL monitor; 0 keeps them forever.
+INTERACTION_LOG_TTL_DAYS = float(os.environ.get("INTERACTION_LOG_TTL_DAYS", "180"))
+
+DUPLICATE_KEY_ERROR = 11000
+INDEX_OPTIONS_CONFLICT = 85
+
+_STOP = object()
+
+
+class InteractionLogWriter:
+    """
+    Buffers interaction records and writes them to `collection` in batches.
+    `record(entry)` never blocks or raises; `start()` and `close()` bracket the
+    background flusher (close flushes whatever is still queued).
+    """
+
+    def __init__(self, collection, queue_size=INTERACTION_LOG_QUEUE_SIZE, batch_size=INTERACTION_LOG_BATCH_SIZE,
+                 flush_interval=INTERACTION_LOG_FLUSH_INTERVAL, retries=INTERACTION_LOG_RETRIES,
+                 retry_base_delay=INTERACTION_LOG_RETRY_BASE_DELAY, overflow=INTERACTION_LOG_OVERFLOW,
+                 spill_path=INTERACTION_LOG_SPILL_PATH, ttl_days=INTERACTION_LOG_TTL_DAYS):
+        if overflow not in ("drop", "spill"):
+            raise ValueError(f"INTERACTION_LOG_OVERFLOW must be 'drop' or 'spill', not '{overflow}'.")
+        self.collection = collection
+        self.queue_size = max(1, queue_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_base_delay = retry_base_delay
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.ttl_days = ttl_days
+        # pymongo is synchronous: one thread writes batches, another appends to the spill file.
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="interaction-log")
+        self._spill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="interaction-spill")
+        self._queue = None
+        self._overflowed = []
+        self._flusher = None
+        self._replaying = None
+        # Metrics
+        self.queued = 0
+        self.written = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.batches = 0
+
+    async def start(self):
+        # Created here so the queue binds to the server's event loop.
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._db_executor, self.ensure_indexes)
+        except PyMongoError as e:
+            logger.warning(f"Could not create interaction-log indexes: {e}")
+        self._flusher = asyncio.ensure_future(self._run(self._queue))
+        self._schedule_replay()
+
+    async def close(self):
+        """Flushes everything queued (one attempt per batch, then spill/drop) and stops."""
+        if self._flusher is not None:
+            queue, self._queue = self._queue, None  # No new records from here on.
+            await queue.put(_STOP)
+            await self._flusher
+            self._flusher = None
+        if self._replaying is not None:
+            await asyncio.gather(self._replaying, return_exceptions=True)
+        await self._flush_overflow()
+        self._db_executor.shutdown(wait=True)
+        self._spill_executor.shutdown(wait=True)
+
+    def ensure_indexes(self):
+        """Per-farmer history lookups, plus TTL expiry on `timestamp` (blocking)."""
+        self.collection.create_index([("farmer_id", ASCENDING), ("timestamp", DESCENDING)])
+        self.collection.create_index([("turn_id", ASCENDING)])
+        if self.ttl_days <= 0:
+            return
+        expire_after = int(self.ttl_days * 86400)
+        try:
+            self.collection.create_index([("timestamp", ASCENDING)], expireAfterSeconds=expire_after)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise
+            # The TTL changed since the index was built; update it in place.
+            self.collection.database.command(
+                "collMod", self.collection.name,
+                index={"keyPattern": {"timestamp": 1}, "expireAfterSeconds": expire_after},
+            )
+
+    def record(self, entry):
+        """Queues one interaction record for writing; called from the chat path."""
+        if self._queue is None:  # Disabled, or shutting down.
+            return
+        entry.setdefault("timestamp", datetime.utcnow())
+        try:
+            self._queue.put_nowait(entry)
+            self.queued += 1
+        except asyncio.QueueFull:
+            if self.overflow == "spill":
+                self._overflowed.append(entry)
+                if len(self._overflowed) >= self.batch_size:
+                    asyncio.ensure_future(self._flush_overflow())
+            else:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning(f"Interaction log queue is full; {self.dropped} record(s) dropped so far.")
+
+    async def _next_batch(self, queue):
+        """
+        Waits for a record, then collects more until the batch is full or the
+        interval passes. Returns (batch, stopping).
+        """
+        loop = asyncio.get_running_loop()
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            try:
+                entry = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = None if deadline is None else deadline - loop.time()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+            if deadline is None:
+                deadline = loop.time() + self.flush_interval
+        return batch, False
+
+    async def _run(self, queue):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch(queue)
+            if not batch:
+                continue
+            # While shutting down, don't hold the process up retrying; spill or drop instead.
+            if await self._write(batch, retries=0 if stopping else None):
+                await self._flush_overflow()
+                if not stopping and queue.qsize() < self.batch_size:
+                    self._schedule_replay()
+
+    def _insert(self, batch):
+        # Unordered, so one bad record doesn't stop the rest of the batch.
+        self.collection.insert_many(batch, ordered=False)
+
+    async def _write(self, batch, retries=None):
+        """Writes one batch with retries; returns False if it had to be spilled or dropped."""
+        retries = self.retries if retries is None else retries
+        loop = asyncio.get_running_loop()
+        for attempt in range(retries + 1):
+            try:
+                await loop.run_in_executor(self._db_executor, self._insert, batch)
+                self.written += len(batch)
+                self.batches += 1
+                return True
+            except BulkWriteError as e:
+                # Duplicates are records a timed-out earlier attempt already wrote; they aren't new inserts.
+                write_errors = e.details.get("writeErrors", [])
+                errors = [error for error in write_errors if error.get("code") != DUPLICATE_KEY_ERROR]
+                self.written += e.details.get("nInserted", 0)
+                self.duplicates += len(write_errors) - len(errors)
+                self.failed += len(errors)
+                self.batches += 1
+                if errors:
+                    logger.error(f"{len(errors)} interaction record(s) rejected: {errors[0].get('errmsg')}")
+                return True
+            except PyMongoError as e:
+                if attempt == retries:
+                    logger.error(f"Writing {len(batch)} interaction record(s) failed: {e}")
+                    break
+                logger.warning(f"Writing interaction records failed ({e}); retrying (attempt {attempt + 1}).")
+                await asyncio.sleep(random.uniform(0, self.retry_base_delay * 2 ** attempt))
+
+        if self.overflow == "spill":
+            await self._spill(batch)
+        else:
+            self.dropped += len(batch)
+        return False
+
+    async def _flush_overflow(self):
+        if self._overflowed:
+            overflowed, self._overflowed = self._overflowed, []
+            await self._spill(overflowed)
+
+    def _append_to_spill(self, records):
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json_util.dumps(record) + "\n")
+
+    async def _spill(self, records):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._spill_executor, self._append_to_spill, records)
+            self.spilled += len(records)
+        except OSError as e:
+            self.dropped += len(records)
+            logger.error(f"Could not spill {len(records)} interaction record(s) to {self.spill_path}: {e}")
+
+    def _schedule_replay(self):
+        if self.overflow != "spill":
+            return
+        # A leftover .replay file is an interrupted replay, to be finished even if nothing new was spilled.
+        if not (os.path.exists(self.spill_path) or os.path.exists(f"{self.spill_path}.replay")):
+            return
+        if self._replaying is None or self._replaying.done():
+            self._replaying = asyncio.ensure_future(self._replay())
+
+    def _open_spill_file(self):
+        """Moves the spill file aside (new spills start a fresh one) and opens it for reading."""
+        replay_path = f"{self.spill_path}.replay"
+        if not os.path.exists(replay_path):  # Otherwise an interrupted replay is finished first.
+            os.replace(self.spill_path, replay_path)
+        return replay_path, open(replay_path, "r", encoding="utf-8")
+
+    @staticmethod
+    def _read_records(f, count):
+        records = []
+        for line in f:
+            if line.strip():
+                records.append(json_util.loads(line))
+                if len(records) >= count:
+                    break
+        return records
+
+    async def _replay(self):
+        """Writes spilled records back, a batch at a time, once MongoDB is keeping up again."""
+        loop = asyncio.get_running_loop()
+        try:
+            replay_path, f = await loop.run_in_executor(self._spill_executor, self._open_spill_file)
+        except OSError as e:
+            logger.error(f"Could not open the interaction-log spill file: {e}")
+            return
+        logger.info(f"Replaying spilled interaction records from {replay_path}.")
+        try:
+            while True:
+                batch = await loop.run_in_executor(self._spill_executor, self._read_records, f, self.batch_size)
+                if not batch:
+                    break
+                # A failed batch goes back into the new spill file, so this one can always be removed.
+                if await self._write(batch):
+                    self.replayed += len(batch)
+        except ValueError as e:
+            logger.error(f"Skipping the rest of {replay_path}, which is corrupt: {e}")
+        finally:
+            f.close()
+        await loop.run_in_executor(self._spill_executor, os.remove, replay_path)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "queued": self.queued,
+            "written": self.written,
+            "duplicates": self.duplicates,
+            "batches": self.batches,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+        }
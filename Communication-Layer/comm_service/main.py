@@ -2,14 +2,19 @@
 
 import os
 import logging
-import httpx
-import websockets
-import asyncio
 import json
+import time
 
+from typing import List
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from pymongo import MongoClient
 
+from clients import AgentConnectionPool, create_ai_client, post_with_retries
+from interaction_log import INTERACTION_LOG_ENABLED, InteractionLogWriter
+from profiles import FarmerProfileCache
+from relay import OrderedStage, run_until_first_failure
+from tracing import correlation_id, metrics_response, new_correlation_id, observe, span, trace_headers
+
 # --- Configuration & DB Connection ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,93 +23,222 @@ DATABASE_URL = os.environ.get("DATABASE_URL")
 AI_SERVICE_URL = os.environ.get("STT_TTS_SERVICE_URL") # Renamed for clarity
 AGENTIC_CORE_WEBSOCKET_URL = os.environ.get("AGENTIC_CORE_WEBSOCKET_URL")
 FARMERS_COLLECTION = "farmers-data"
+INTERACTION_LOGS_COLLECTION = "interaction-log"
 
 client = MongoClient(DATABASE_URL)
 db = client.nandi_system
 farmers_collection = db[FARMERS_COLLECTION]
+profile_cache = FarmerProfileCache(farmers_collection)
+# Every turn is recorded for audit and analytics, written in batches off the chat path.
+interaction_log = InteractionLogWriter(db[INTERACTION_LOGS_COLLECTION])
 
 app = FastAPI(title="NANDI Live Communication Service")
 
+# Shared across all sessions; created on startup so they bind to the server's loop.
+ai_client = None
+agent_pool = None
+
+@app.on_event("startup")
+async def startup_event():
+    global ai_client, agent_pool
+    ai_client = create_ai_client()
+    agent_pool = AgentConnectionPool(AGENTIC_CORE_WEBSOCKET_URL)
+    await agent_pool.start()
+    if INTERACTION_LOG_ENABLED:
+        await interaction_log.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await agent_pool.close()
+    await ai_client.aclose()
+    await interaction_log.close()
+    profile_cache.close()
+
+async def process_text(payload):
+    """Calls the AI service's /process endpoint over the shared connection pool."""
+    response = await post_with_retries(ai_client, f"{AI_SERVICE_URL}/process", json=payload, headers=trace_headers())
+    response.raise_for_status()
+    return response.json()["result_text"]
+
+async def process_texts(texts, source_lang, target_lang):
+    """
+    Batch form of process_text: the AI service splits the texts into sentences
+    and translates them all in one padded batch.
+    """
+    payload = {"texts": texts, "source_lang": source_lang, "target_lang": target_lang}
+    response = await post_with_retries(ai_client, f"{AI_SERVICE_URL}/process", json=payload, headers=trace_headers())
+    response.raise_for_status()
+    return response.json()["result_texts"]
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "agent_pool": agent_pool.stats(),
+        "profile_cache": profile_cache.stats(),
+        "interaction_log": interaction_log.stats(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms for chat turns."""
+    return metrics_response()
+
+# --- Profile Cache Hooks ---
+@app.post("/profiles/{phone_number}/invalidate")
+async def invalidate_profile(phone_number: str):
+    """Call after a farmer's profile changes so the next session re-reads it."""
+    profile_cache.invalidate(f"+{phone_number}")
+    return {"invalidated": f"+{phone_number}"}
+
+@app.post("/profiles/prefetch")
+async def prefetch_profiles(phone_numbers: List[str]):
+    """Warms the cache for farmers expected to connect soon (e.g. a campaign list)."""
+    farmer_ids = [number if number.startswith("+") else f"+{number}" for number in phone_numbers]
+    found = await profile_cache.prefetch(farmer_ids)
+    return {"requested": len(farmer_ids), "found": found}
+
 # --- Main WebSocket Endpoint ---
 @app.websocket("/ws/chat/{phone_number}")
 async def handle_live_chat(websocket: WebSocket, phone_number: str):
     await websocket.accept()
-    
-    farmer = farmers_collection.find_one({"_id": f"+{phone_number}"})
+    # Tags this session's calls to other services; each message gets its own turn ID below.
+    session_id = new_correlation_id()
+    correlation_id.set(session_id)
+
+    with span("profile_lookup"):
+        farmer = await profile_cache.get(f"+{phone_number}")
     if not farmer:
         await websocket.close(code=1008, reason="Farmer not found")
         return
 
-    logger.info(f"Session started for {farmer['name']} ({farmer['_id']}).")
+    logger.info(f"Session {session_id} started for {farmer['name']} ({farmer['_id']}).")
 
     # --- Session Language Pipeline ---
-    # Determine the language to use for this entire conversation.
-    supported_languages = ["Marathi", "Hindi", "Tamil", "English"]
-    session_language = "English" # Default
-    if farmer.get("primary_language") in supported_languages:
-        session_language = farmer["primary_language"]
-    elif farmer.get("secondary_language") in supported_languages:
-        session_language = farmer["secondary_language"]
-    
+    # Resolved once per profile load and cached alongside it.
+    session_language = farmer["session_language"]
     logger.info(f"Session language set to: {session_language}")
 
     # --- Send Greeting ---
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            greeting_text = f"Hello {farmer['name'].split()[0]}, I am the NANDI assistant. How can I help you?"
-            response = await client.post(
-                f"{AI_SERVICE_URL}/process",
-                json={"text": greeting_text, "source_lang": "English", "target_lang": session_language}
+        greeting_text = f"Hello {farmer['name'].split()[0]}, I am the NANDI assistant. How can I help you?"
+        with span("greeting"):
+            greeting = await process_text(
+                {"text": greeting_text, "source_lang": "English", "target_lang": session_language}
             )
-            greeting = response.json()["result_text"]
-            await websocket.send_text(json.dumps({"sender": "agent", "message": greeting}))
+        await websocket.send_text(json.dumps({"sender": "agent", "message": greeting}))
     except Exception as e:
         logger.error(f"Failed to send greeting: {e}")
         await websocket.send_text(json.dumps({"sender": "agent", "message": f"Hello {farmer['name']}."}))
 
     # --- Main Relay Loop ---
     try:
-        async with websockets.connect(AGENTIC_CORE_WEBSOCKET_URL) as agent_socket:
+        async with agent_pool.session() as agent_socket:
             logger.info(f"Connected to Agentic Core for farmer {farmer['_id']}")
+            # The turn the agent is currently answering, and when the farmer sent it.
+            current_turn = {"id": session_id, "received_at": None, "sent_at": None, "answered": True}
+
+            def log_interaction(direction, message, message_english, latency_ms):
+                interaction_log.record({
+                    "farmer_id": farmer["_id"],
+                    "session_id": session_id,
+                    "turn_id": current_turn["id"],
+                    "direction": direction,
+                    "language": session_language,
+                    "message": message,
+                    "message_english": message_english,
+                    "latency_ms": latency_ms,
+                })
+
+            async def user_to_english(turn):
+                """Process user input (STT and/or Translate to English)"""
+                correlation_id.set(turn["id"])
+                data = turn["data"]
+                process_payload = {
+                    "source_lang": session_language,
+                    "target_lang": "English"
+                }
+                if data.get("type") == "audio":
+                    process_payload["media_url"] = data["url"]
+                else:
+                    process_payload["text"] = data["message"]
+                start = time.perf_counter()
+                try:
+                    turn["english"] = await process_text(process_payload)
+                finally:
+                    turn["to_english_seconds"] = time.perf_counter() - start
+                    observe("user_to_english", turn["to_english_seconds"])
+                return turn
+
+            async def send_to_agent(turn):
+                # Prepare and send packet to the agent
+                agent_packet = { "farmer_id": farmer["_id"], "query": turn["english"], "correlation_id": turn["id"] }
+                await agent_socket.send(json.dumps(agent_packet))
+                current_turn.update(id=turn["id"], received_at=turn["received_at"], sent_at=time.perf_counter(), answered=False)
+                data = turn["data"]
+                log_interaction(
+                    "farmer", data.get("url") if data.get("type") == "audio" else data.get("message"), turn["english"],
+                    {"to_english": round(turn["to_english_seconds"] * 1000, 1)},
+                )
+
+            async def agent_to_user_language(agent_message_english):
+                # Translate agent's English response back to the user's session language.
+                # Batch mode splits long (e.g. RAG) answers into sentences translated together.
+                correlation_id.set(current_turn["id"])
+                reply = {"english": agent_message_english, "latency_ms": {}}
+                if not current_turn["answered"] and current_turn["sent_at"] is not None:
+                    agent_seconds = time.perf_counter() - current_turn["sent_at"]
+                    observe("agent_first_reply", agent_seconds)
+                    reply["latency_ms"]["agent"] = round(agent_seconds * 1000, 1)
+                    current_turn["sent_at"] = None
+                start = time.perf_counter()
+                try:
+                    translated = await process_texts([agent_message_english], "English", session_language)
+                finally:
+                    to_user_seconds = time.perf_counter() - start
+                    observe("agent_to_user", to_user_seconds)
+                reply["latency_ms"]["to_user"] = round(to_user_seconds * 1000, 1)
+                reply["translated"] = translated[0]
+                return reply
+
+            async def send_to_user(reply):
+                await websocket.send_text(json.dumps({"sender": "agent", "message": reply["translated"]}))
+                if not current_turn["answered"]:
+                    # Farmer's message in, first reply out: what the farmer actually waits for.
+                    current_turn["answered"] = True
+                    correlation_id.set(current_turn["id"])
+                    turn_seconds = time.perf_counter() - current_turn["received_at"]
+                    observe("turn", turn_seconds)
+                    reply["latency_ms"]["turn"] = round(turn_seconds * 1000, 1)
+                log_interaction("agent", reply["translated"], reply["english"], reply["latency_ms"])
+
+            # Messages are translated concurrently but delivered in arrival order.
+            to_agent = OrderedStage(f"{farmer['_id']} user->agent", user_to_english, send_to_agent)
+            to_user = OrderedStage(f"{farmer['_id']} agent->user", agent_to_user_language, send_to_user)
 
             async def forward_to_agent():
                 """User -> English -> Agent"""
+                turn = 0
                 while True:
                     raw_message = await websocket.receive_text()
-                    data = json.loads(raw_message)
-                    
-                    # Process user input (STT and/or Translate to English)
-                    async with httpx.AsyncClient(timeout=60.0) as client:
-                        process_payload = {
-                            "source_lang": session_language,
-                            "target_lang": "English"
-                        }
-                        if data.get("type") == "audio":
-                            process_payload["media_url"] = data["url"]
-                        else:
-                            process_payload["text"] = data["message"]
-                        
-                        response = await client.post(f"{AI_SERVICE_URL}/process", json=process_payload)
-                        english_text = response.json()["result_text"]
-
-                    # Prepare and send packet to the agent
-                    agent_packet = { "farmer_id": farmer["_id"], "query": english_text }
-                    await agent_socket.send(json.dumps(agent_packet))
+                    turn += 1
+                    await to_agent.submit(
+                        {"id": f"{session_id}-{turn}", "received_at": time.perf_counter(), "data": json.loads(raw_message)}
+                    )
 
             async def forward_to_user():
                 """Agent (English) -> User Language -> User"""
                 async for agent_message_english in agent_socket:
-                    # Translate agent's English response back to the user's session language
-                    async with httpx.AsyncClient(timeout=30.0) as client:
-                        response = await client.post(
-                            f"{AI_SERVICE_URL}/process",
-                            json={"text": agent_message_english, "source_lang": "English", "target_lang": session_language}
-                        )
-                        user_lang_message = response.json()["result_text"]
-                    
-                    await websocket.send_text(json.dumps({"sender": "agent", "message": user_lang_message}))
-
-            await asyncio.gather(forward_to_agent(), forward_to_user())
+                    await to_user.submit(agent_message_english)
+                await to_user.finish()
+
+            try:
+                await run_until_first_failure(
+                    forward_to_agent(), to_agent.run(), forward_to_user(), to_user.run()
+                )
+            finally:
+                to_agent.cancel()
+                to_user.cancel()
 
     except WebSocketDisconnect:
         logger.info(f"User {farmer['name']} disconnected.")
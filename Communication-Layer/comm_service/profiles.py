@@ -0,0 +1,139 @@
+# comm_service/profiles.py
+# Read-through cache for farmer profiles.
+# pymongo is synchronous, so lookups run on a small dedicated thread pool rather
+# than on the event loop. Only the fields a chat session needs are fetched, and
+# concurrent lookups for the same farmer (reconnect storms) share one query.
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", "300"))
+# Unknown numbers are remembered briefly so repeated bad connects don't hit Mongo.
+PROFILE_NEGATIVE_TTL = float(os.environ.get("PROFILE_NEGATIVE_TTL", "30"))
+PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get("PROFILE_CACHE_MAX_ENTRIES", "50000"))
+PROFILE_DB_WORKERS = int(os.environ.get("PROFILE_DB_WORKERS", "16"))
+PROFILE_PREFETCH_BATCH_SIZE = int(os.environ.get("PROFILE_PREFETCH_BATCH_SIZE", "500"))
+
+# Fields actually used by a chat session.
+PROFILE_PROJECTION = {"name": 1, "primary_language": 1, "secondary_language": 1}
+SESSION_LANGUAGES = ["Marathi", "Hindi", "Tamil", "English"]
+
+
+def resolve_session_language(farmer):
+    """Determine the language to use for this entire conversation."""
+    if farmer.get("primary_language") in SESSION_LANGUAGES:
+        return farmer["primary_language"]
+    if farmer.get("secondary_language") in SESSION_LANGUAGES:
+        return farmer["secondary_language"]
+    return "English"  # Default
+
+
+class FarmerProfileCache:
+    """
+    Caches projected farmer documents (plus their resolved `session_language`)
+    by `_id`. `get` returns None for unknown farmers.
+    """
+
+    def __init__(self, collection, ttl=PROFILE_CACHE_TTL, negative_ttl=PROFILE_NEGATIVE_TTL,
+                 max_entries=PROFILE_CACHE_MAX_ENTRIES, workers=PROFILE_DB_WORKERS):
+        self.collection = collection
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="profiles")
+        self._entries = OrderedDict()
+        self._inflight = {}
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    async def get(self, farmer_id):
+        entry = self._entries.get(farmer_id)
+        if entry is not None:
+            profile, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(farmer_id)
+                self.hits += 1
+                return profile
+            del self._entries[farmer_id]
+
+        lookup = self._inflight.get(farmer_id)
+        if lookup is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            lookup = asyncio.ensure_future(self._load(farmer_id))
+            self._inflight[farmer_id] = lookup
+        return await asyncio.shield(lookup)
+
+    async def _load(self, farmer_id):
+        try:
+            loop = asyncio.get_running_loop()
+            farmer = await loop.run_in_executor(
+                self._executor, self.collection.find_one, {"_id": farmer_id}, PROFILE_PROJECTION
+            )
+        finally:
+            self._inflight.pop(farmer_id, None)
+        return self._store(farmer_id, farmer)
+
+    def _store(self, farmer_id, farmer):
+        if farmer is not None:
+            farmer["session_language"] = resolve_session_language(farmer)
+            expires_at = time.monotonic() + self.ttl
+        else:
+            expires_at = time.monotonic() + self.negative_ttl
+        self._entries[farmer_id] = (farmer, expires_at)
+        self._entries.move_to_end(farmer_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return farmer
+
+    def invalidate(self, farmer_id=None):
+        """Drops one cached profile (e.g. after a language change), or all of them."""
+        self.invalidations += 1
+        if farmer_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(farmer_id, None)
+
+    async def prefetch(self, farmer_ids, batch_size=PROFILE_PREFETCH_BATCH_SIZE):
+        """Warms the cache for many farmers with one `$in` query per batch."""
+        loop = asyncio.get_running_loop()
+        farmer_ids = list(dict.fromkeys(farmer_ids))
+        found = 0
+        for start in range(0, len(farmer_ids), batch_size):
+            batch = farmer_ids[start:start + batch_size]
+            farmers = await loop.run_in_executor(self._executor, self._find_many, batch)
+            for farmer_id in batch:
+                farmer = farmers.get(farmer_id)
+                found += farmer is not None
+                self._store(farmer_id, farmer)
+        logger.info(f"Prefetched {found}/{len(farmer_ids)} farmer profiles.")
+        return found
+
+    def _find_many(self, farmer_ids):
+        cursor = self.collection.find({"_id": {"$in": farmer_ids}}, PROFILE_PROJECTION)
+        return {farmer["_id"]: farmer for farmer in cursor}
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
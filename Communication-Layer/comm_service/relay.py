@@ -0,0 +1,82 @@
+# comm_service/relay.py
+# Ordered, bounded pipeline stages for the chat relay.
+# Each direction of a session (user -> agent, agent -> user) translates up to N
+# messages concurrently but always delivers them in the order they arrived.
+# When N messages are in flight, `submit` waits, which stops reading from the
+# sending socket and pushes backpressure onto that side.
+
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+RELAY_MAX_IN_FLIGHT = int(os.environ.get("RELAY_MAX_IN_FLIGHT", "4"))
+
+_END = object()
+
+
+class OrderedStage:
+    """
+    `transform(item)` runs concurrently for queued items; `deliver(result)` is
+    called with the results strictly in submission order. A failed transform is
+    logged and its message skipped, so one bad message doesn't end the session.
+    """
+
+    def __init__(self, name, transform, deliver, max_in_flight=RELAY_MAX_IN_FLIGHT):
+        self.name = name
+        self.transform = transform
+        self.deliver = deliver
+        self._slots = asyncio.Semaphore(max(1, max_in_flight))
+        self._order = asyncio.Queue()
+
+    async def submit(self, item):
+        """Starts transforming `item`; waits while the stage is full."""
+        await self._slots.acquire()
+        await self._order.put(asyncio.ensure_future(self.transform(item)))
+
+    async def finish(self):
+        """Marks the end of input; `run` returns once everything queued is delivered."""
+        await self._order.put(_END)
+
+    async def run(self):
+        """Delivery loop: awaits each transform in order and hands its result on."""
+        while True:
+            task = await self._order.get()
+            if task is _END:
+                return
+            try:
+                try:
+                    result = await task
+                except Exception as e:
+                    logger.error(f"[{self.name}] Dropping message after processing failed: {e}")
+                    continue
+                await self.deliver(result)
+            finally:
+                self._slots.release()
+
+    def cancel(self):
+        """Cancels every transform still in flight (e.g. when the socket closes)."""
+        while not self._order.empty():
+            task = self._order.get_nowait()
+            if task is not _END:
+                task.cancel()
+
+
+async def run_until_first_failure(*coroutines):
+    """
+    Runs the session's coroutines together. Ones that finish normally (e.g. the
+    agent closing its side) let the rest continue; the first exception cancels
+    everything still running and is re-raised.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,66 @@
+# comm_service/tracing.py
+# Correlation IDs and per-stage latency metrics for the chat relay.
+# Every chat session gets an ID and every farmer message a turn ID derived from
+# it. The ID travels to the AI service as an X-Correlation-ID header and to the
+# agentic core inside the query packet, so one slow reply can be followed
+# across the services' logs. Stage timings feed a Prometheus histogram served
+# at /metrics.
+
+import contextvars
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Spans at least this slow are logged at INFO with their correlation ID; the rest at DEBUG.
+TRACE_SLOW_SPAN_MS = float(os.environ.get("TRACE_SLOW_SPAN_MS", "500"))
+
+CORRELATION_HEADER = "X-Correlation-ID"
+
+# Set per session (and per turn inside the relay's tasks); read when calling other services.
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+STAGE_SECONDS = Histogram(
+    "nandi_comm_stage_seconds",
+    "Time spent in each stage of a chat turn.",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+
+def new_correlation_id():
+    return uuid.uuid4().hex[:16]
+
+
+def trace_headers():
+    """Headers that carry the current correlation ID to another service."""
+    current = correlation_id.get()
+    return {CORRELATION_HEADER: current} if current else {}
+
+
+def observe(stage, seconds):
+    """Records a stage timing measured elsewhere (e.g. across two callbacks)."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    level = logging.INFO if seconds * 1000 >= TRACE_SLOW_SPAN_MS else logging.DEBUG
+    logger.log(level, f"[{correlation_id.get()}] {stage} took {seconds * 1000:.0f} ms")
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as `stage`, whether it succeeds or fails."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def metrics_response():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
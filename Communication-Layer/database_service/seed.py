@@ -2,16 +2,30 @@
 ''' 
 This script connects to the MongoDB instance and populates it with
 initial mock data for farmers. It's run once by the db_seeder service.
+
+With --synthetic N (or SEED_SYNTHETIC_FARMERS=N) it also generates N realistic
+farmer profiles, streamed in chunks through unordered bulk upserts, so lookup
+and fan-out queries can be benchmarked at production scale. Profiles are
+deterministic per index, so re-running (or resuming with --start) is safe.
 '''
 
+import argparse
 import os
 import logging
-from pymongo import MongoClient
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pymongo import ASCENDING, GEOSPHERE, MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+SEED_SYNTHETIC_FARMERS = int(os.environ.get("SEED_SYNTHETIC_FARMERS", "0"))
+SEED_CHUNK_SIZE = int(os.environ.get("SEED_CHUNK_SIZE", "10000"))
+SEED_WORKERS = int(os.environ.get("SEED_WORKERS", "4"))
+SEED_RANDOM_SEED = int(os.environ.get("SEED_RANDOM_SEED", "42"))
 
 FARMERS_DATA = [
   {
@@ -199,8 +213,170 @@ FARMERS_DATA = [
 INTERACTION_LOGS_COLLECTION = "interaction-log"
 FARMERS_COLLECTION = "farmers-data"
 
-def seed_database():
-    """Connects to MongoDB and inserts mock data if the collection is empty."""
+# --- Synthetic Profiles ---
+# (state, district, longitude, latitude, regional language, villages/towns)
+DISTRICTS = [
+    ("maharashtra", "pune", 73.8567, 18.5204, "Marathi", ["lonavala", "baramati", "junnar", "indapur"]),
+    ("maharashtra", "nashik", 73.7898, 19.9975, "Marathi", ["niphad", "sinnar", "yeola", "dindori"]),
+    ("maharashtra", "nagpur", 79.0882, 21.1458, "Marathi", ["katol", "umred", "ramtek", "saoner"]),
+    ("maharashtra", "solapur", 75.9064, 17.6599, "Marathi", ["pandharpur", "barshi", "akkalkot", "mohol"]),
+    ("madhya pradesh", "indore", 75.8577, 22.7196, "Hindi", ["mhow", "depalpur", "sanwer", "hatod"]),
+    ("madhya pradesh", "bhopal", 77.4126, 23.2599, "Hindi", ["berasia", "phanda", "bairagarh", "kolar"]),
+    ("uttar pradesh", "lucknow", 80.9462, 26.8467, "Hindi", ["malihabad", "mohanlalganj", "bakshi ka talab", "kakori"]),
+    ("uttar pradesh", "varanasi", 82.9739, 25.3176, "Hindi", ["pindra", "rajatalab", "chiraigaon", "cholapur"]),
+    ("bihar", "patna", 85.1376, 25.5941, "Hindi", ["danapur", "masaurhi", "barh", "bikram"]),
+    ("rajasthan", "jaipur", 75.7873, 26.9124, "Hindi", ["sanganer", "chomu", "amer", "bassi"]),
+    ("haryana", "karnal", 76.9905, 29.6857, "Hindi", ["gharaunda", "nilokheri", "assandh", "indri"]),
+    ("punjab", "ludhiana", 75.8573, 30.9010, "Punjabi", ["khanna", "jagraon", "samrala", "raikot"]),
+    ("punjab", "amritsar", 74.8723, 31.6340, "Punjabi", ["ajnala", "baba bakala", "majitha", "tarn taran"]),
+    ("gujarat", "anand", 72.9289, 22.5645, "Gujarati", ["borsad", "petlad", "khambhat", "umreth"]),
+    ("gujarat", "rajkot", 70.8022, 22.3039, "Gujarati", ["gondal", "jetpur", "dhoraji", "upleta"]),
+    ("tamil nadu", "thanjavur", 79.1378, 10.7870, "Tamil", ["kumbakonam", "papanasam", "orathanadu", "pattukkottai"]),
+    ("tamil nadu", "coimbatore", 76.9558, 11.0168, "Tamil", ["pollachi", "mettupalayam", "annur", "sulur"]),
+    ("tamil nadu", "madurai", 78.1198, 9.9252, "Tamil", ["melur", "usilampatti", "peraiyur", "vadipatti"]),
+    ("karnataka", "mandya", 76.8958, 12.5218, "Kannada", ["maddur", "malavalli", "srirangapatna", "pandavapura"]),
+    ("karnataka", "belagavi", 74.4977, 15.8497, "Kannada", ["gokak", "athani", "chikkodi", "saundatti"]),
+    ("andhra pradesh", "guntur", 80.4365, 16.3067, "Telugu", ["tenali", "narasaraopet", "ponnur", "sattenapalle"]),
+    ("telangana", "warangal", 79.5941, 17.9689, "Telugu", ["hanamkonda", "narsampet", "parkal", "wardhannapet"]),
+    ("kerala", "palakkad", 76.6548, 10.7867, "Malayalam", ["ottapalam", "chittur", "alathur", "mannarkkad"]),
+    ("west bengal", "bardhaman", 87.8615, 23.2324, "Bengali", ["kalna", "katwa", "memari", "guskara"]),
+    ("odisha", "cuttack", 85.8830, 20.4625, "Odia", ["athagarh", "banki", "salepur", "niali"]),
+    ("assam", "nagaon", 92.6838, 26.3480, "Assamese", ["kaliabor", "raha", "samaguri", "dhing"]),
+    ("chhattisgarh", "raipur", 81.6296, 21.2514, "Hindi", ["arang", "abhanpur", "tilda", "dharsiwa"]),
+]
+FIRST_NAMES = {
+    "Marathi": ["Rohan", "Sachin", "Vitthal", "Sunita", "Anjali", "Ganesh", "Savita", "Mahesh"],
+    "Hindi": ["Ramesh", "Sita", "Suresh", "Geeta", "Rajesh", "Kavita", "Manoj", "Pooja"],
+    "Punjabi": ["Gurpreet", "Harjit", "Manpreet", "Simran", "Baldev", "Jaspreet"],
+    "Gujarati": ["Bhavesh", "Hetal", "Jignesh", "Nisha", "Kiran", "Dhaval"],
+    "Tamil": ["Murugan", "Lakshmi", "Karthik", "Meena", "Selvam", "Kavitha"],
+    "Kannada": ["Manjunath", "Deepa", "Basavaraj", "Shobha", "Nagaraj", "Rekha"],
+    "Telugu": ["Krishna", "Padma", "Srinivas", "Lavanya", "Venkatesh", "Swathi"],
+    "Malayalam": ["Fatima", "Joseph", "Suresh", "Anitha", "Rajan", "Bindu"],
+    "Bengali": ["Sourav", "Rina", "Arup", "Mousumi", "Tapas", "Shila"],
+    "Odia": ["Bijay", "Sasmita", "Prakash", "Namita", "Ranjan", "Sabita"],
+    "Assamese": ["Bhaskar", "Pranita", "Dipankar", "Jonali", "Hemanta", "Rupa"],
+}
+LAST_NAMES = {
+    "Marathi": ["Deshmukh", "Patil", "Pawar", "Jadhav", "Shinde", "Kulkarni"],
+    "Hindi": ["Sharma", "Yadav", "Singh", "Verma", "Kumar", "Mishra"],
+    "Punjabi": ["Singh", "Kaur", "Sandhu", "Gill", "Dhillon", "Brar"],
+    "Gujarati": ["Patel", "Shah", "Desai", "Chaudhari", "Parmar", "Solanki"],
+    "Tamil": ["Subramanian", "Murugesan", "Pandian", "Raman", "Selvaraj", "Krishnan"],
+    "Kannada": ["Gowda", "Hegde", "Patil", "Shetty", "Naik", "Rao"],
+    "Telugu": ["Reddy", "Naidu", "Rao", "Chowdary", "Varma", "Raju"],
+    "Malayalam": ["Nair", "Menon", "Pillai", "Beevi", "Thomas", "Kurian"],
+    "Bengali": ["Das", "Ghosh", "Mondal", "Roy", "Sarkar", "Pal"],
+    "Odia": ["Mohanty", "Behera", "Sahoo", "Nayak", "Swain", "Das"],
+    "Assamese": ["Bora", "Gogoi", "Saikia", "Kalita", "Deka", "Baruah"],
+}
+# Synthetic numbers start here so they never collide with FARMERS_DATA.
+SYNTHETIC_PHONE_BASE = 6000000000
+
+def synthetic_farmer(index, random_seed=SEED_RANDOM_SEED):
+    """One realistic profile; the same `index` and seed always give the same farmer."""
+    rng = random.Random(random_seed * 10**10 + index)
+    state, district, longitude, latitude, language, villages = rng.choice(DISTRICTS)
+    # Most farms are small: a log-normal around ~2 acres, clipped to 0.25-50 and rounded to 1/4 acre.
+    farm_size = min(50.0, max(0.25, round(rng.lognormvariate(0.7, 0.8) * 4) / 4))
+    # Regional speakers also use Hindi or English; Hindi speakers fall back to English.
+    secondary = "English" if language == "Hindi" else rng.choice(["Hindi", "English"])
+    return {
+        "_id": f"+91{SYNTHETIC_PHONE_BASE + index}",
+        "name": f"{rng.choice(FIRST_NAMES[language])} {rng.choice(LAST_NAMES[language])}",
+        "aadhar_number": f"{rng.randrange(2 * 10**11, 10**12)}",
+        "primary_language": language,
+        "secondary_language": secondary,
+        "location": {
+            "state": state,
+            "district": district,
+            "village/town": rng.choice(villages),
+            # [longitude, latitude], scattered within ~30 km of the district centre.
+            "coordinates": [round(longitude + rng.uniform(-0.3, 0.3), 4), round(latitude + rng.uniform(-0.3, 0.3), 4)],
+        },
+        "farm_size_acres": farm_size,
+        "synthetic": True,
+    }
+
+def synthetic_chunks(count, chunk_size, start=0, random_seed=SEED_RANDOM_SEED):
+    """Yields lists of profiles for indexes start .. start + count - 1."""
+    for chunk_start in range(start, start + count, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, start + count)
+        yield [synthetic_farmer(i, random_seed) for i in range(chunk_start, chunk_end)]
+
+def upsert_chunk(collection, farmers):
+    """Upserts one chunk unordered; returns (upserted, modified, failed)."""
+    operations = [ReplaceOne({"_id": farmer["_id"]}, farmer, upsert=True) for farmer in farmers]
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        return result.upserted_count, result.modified_count, 0
+    except BulkWriteError as e:
+        details = e.details
+        failed = len(details.get("writeErrors", []))
+        logger.error(f"{failed} profile(s) in a chunk failed: {details['writeErrors'][0].get('errmsg')}")
+        return details.get("nUpserted", 0), details.get("nModified", 0), failed
+
+def seed_synthetic_farmers(collection, count, chunk_size=SEED_CHUNK_SIZE, workers=SEED_WORKERS, start=0,
+                           random_seed=SEED_RANDOM_SEED):
+    """
+    Streams `count` synthetic profiles into `collection`. Generation stays at most
+    a few chunks ahead of the writes, so memory doesn't grow with `count`.
+    """
+    logger.info(f"Upserting {count} synthetic farmer profiles in chunks of {chunk_size} ({workers} writer(s))...")
+    started = time.monotonic()
+    done = upserted = modified = failed = 0
+    last_report = started
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        in_flight = {}
+        chunks = synthetic_chunks(count, chunk_size, start, random_seed)
+        while True:
+            for chunk in chunks:
+                in_flight[pool.submit(upsert_chunk, collection, chunk)] = len(chunk)
+                if len(in_flight) >= 2 * max(1, workers):
+                    break
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done += in_flight.pop(future)
+                chunk_upserted, chunk_modified, chunk_failed = future.result()
+                upserted += chunk_upserted
+                modified += chunk_modified
+                failed += chunk_failed
+
+            now = time.monotonic()
+            if now - last_report >= 5 or done == count:
+                rate = done / max(now - started, 1e-9)
+                eta = (count - done) / rate if rate else 0
+                logger.info(f"  {done}/{count} profiles ({100 * done / count:.1f}%), {rate:,.0f}/s, ETA {eta:.0f}s")
+                last_report = now
+
+    logger.info(
+        f"Synthetic seeding finished in {time.monotonic() - started:.1f}s: "
+        f"{upserted} inserted, {modified} updated, {failed} failed."
+    )
+
+def ensure_indexes(farmers_collection):
+    """
+    Indexes for location searches and district fan-out queries (built after bulk
+    loads). Fan-out goes to a district, optionally narrowed to one language, so
+    district leads; a language-first index would only help language-wide scans.
+    """
+    logger.info("Ensuring farmer indexes...")
+    farmers_collection.create_index([("location.coordinates", GEOSPHERE)], name="location_2dsphere")
+    farmers_collection.create_index(
+        [("location.state", ASCENDING), ("location.district", ASCENDING)], name="state_district"
+    )
+    farmers_collection.create_index(
+        [("location.district", ASCENDING), ("primary_language", ASCENDING)], name="district_language"
+    )
+
+def seed_database(synthetic_count=SEED_SYNTHETIC_FARMERS, chunk_size=SEED_CHUNK_SIZE, workers=SEED_WORKERS,
+                  start=0, random_seed=SEED_RANDOM_SEED):
+    """
+    Connects to MongoDB and inserts mock data if the collection is empty, then
+    upserts `synthetic_count` generated profiles and ensures the farmer indexes.
+    """
     try:
         logger.info(f"Connecting to MongoDB at {MONGO_URI}...")
         client = MongoClient(MONGO_URI)
@@ -214,6 +390,10 @@ def seed_database():
             logger.info(f"Successfully inserted {len(FARMERS_DATA)} farmer profiles.")
         else:
             logger.info("Farmers collection already contains data. Skipping seed.")
+
+        if synthetic_count > 0:
+            seed_synthetic_farmers(farmers_collection, synthetic_count, chunk_size, workers, start, random_seed)
+        ensure_indexes(farmers_collection)
             
         # Ensure interaction logs collection exists
         if INTERACTION_LOGS_COLLECTION not in db.list_collection_names():
@@ -228,5 +408,16 @@ def seed_database():
         logger.error(f"An error occurred while seeding the database: {e}")
         raise
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed the NANDI database.")
+    parser.add_argument("--synthetic", type=int, default=SEED_SYNTHETIC_FARMERS,
+                        help="number of synthetic farmer profiles to upsert (default: none)")
+    parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE, help="profiles per bulk_write")
+    parser.add_argument("--workers", type=int, default=SEED_WORKERS, help="concurrent bulk_write calls")
+    parser.add_argument("--start", type=int, default=0, help="first synthetic index, to resume or extend a run")
+    parser.add_argument("--seed", type=int, default=SEED_RANDOM_SEED, help="random seed for the generated profiles")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    seed_database()
+    args = parse_args()
+    seed_database(args.synthetic, args.chunk_size, args.workers, args.start, args.seed)
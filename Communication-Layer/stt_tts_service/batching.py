@@ -0,0 +1,130 @@
+# stt_tts_service/batching.py
+# Dynamic micro-batching for the translation pipelines.
+# Concurrent /process calls for the same language pair are collected for a few
+# milliseconds (or until the batch is full) and translated in one forward pass.
+
+import asyncio
+import logging
+import os
+
+from inference import InferenceSaturated
+from tracing import TRANSLATION_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+BATCH_MAX_SIZE = int(os.environ.get("TRANSLATION_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("TRANSLATION_BATCH_MAX_WAIT_MS", "10"))
+BATCH_MAX_PENDING = int(os.environ.get("TRANSLATION_BATCH_MAX_PENDING", "256"))
+
+
+class TranslationBatcher:
+    """
+    Queues translation requests for a single pipeline and runs them as batches.
+    Callers simply `await batcher.translate(text)`; a background task groups
+    whatever is waiting and fans the results back out to each caller.
+    """
+
+    def __init__(self, translator, name, executor, model_name="translation",
+                 max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, max_pending=BATCH_MAX_PENDING):
+        self.translator = translator
+        self.name = name
+        self.executor = executor
+        self.model_name = model_name
+        self.max_pending = max_pending
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._pending = []
+        self._has_items = asyncio.Event()
+        self._is_full = asyncio.Event()
+        self._worker = None
+        self._draining = False
+        # Simple counters, useful for checking the achieved batch size in logs.
+        self.batches_run = 0
+        self.items_processed = 0
+
+    async def translate(self, text):
+        """Submits one text and waits for its translation."""
+        if len(self._pending) >= self.max_pending:
+            raise InferenceSaturated(self.name)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._is_full.set()
+        return await future
+
+    async def stop(self, drain=False):
+        """
+        Stops the background worker. With `drain=True` everything already queued is
+        translated first; otherwise the worker is cancelled and queued callers fail.
+        """
+        if drain and self._worker is not None:
+            self._draining = True
+            self._has_items.set()
+            await self._worker
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for _, future in self._pending:
+            if not future.done():
+                future.set_exception(RuntimeError(f"Translation batcher {self.name} was stopped."))
+        self._pending.clear()
+
+    async def _run(self):
+        while True:
+            if self._draining and not self._pending:
+                return
+            await self._has_items.wait()
+            if not self._pending:
+                self._has_items.clear()
+                continue
+
+            # Give other requests a short window to join this batch.
+            if len(self._pending) < self.max_batch_size and self.max_wait > 0 and not self._draining:
+                try:
+                    await asyncio.wait_for(self._is_full.wait(), timeout=self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if not self._pending:
+                self._has_items.clear()
+            if len(self._pending) < self.max_batch_size:
+                self._is_full.clear()
+
+            # Callers that went away (e.g. client disconnects) don't need a slot.
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            texts = [text for text, _ in batch]
+            try:
+                results = await self.executor.run(self.model_name, self._translate_batch, texts)
+            except Exception as e:
+                logger.error(f"Batched translation failed for {self.name} ({len(texts)} items): {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.items_processed += len(texts)
+            TRANSLATION_BATCH_SIZE.observe(len(texts))
+            logger.debug(f"Translated batch of {len(texts)} for {self.name}")
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _translate_batch(self, texts):
+        """Runs one forward pass over the whole batch (called in a worker thread)."""
+        outputs = self.translator(texts, batch_size=len(texts))
+        return [output["translation_text"] for output in outputs]
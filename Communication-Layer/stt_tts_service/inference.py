@@ -0,0 +1,144 @@
+# stt_tts_service/inference.py
+# A bounded worker pool that every model call goes through.
+# Inference runs in worker threads (torch releases the GIL during forward passes),
+# so the event loop stays free for health checks and cheap passthrough requests.
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import INFERENCE_SECONDS, QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", str(os.cpu_count() or 4)))
+INFERENCE_MAX_QUEUE_DEPTH = int(os.environ.get("INFERENCE_MAX_QUEUE_DEPTH", "64"))
+
+
+class InferenceSaturated(Exception):
+    """Raised when a model's wait queue is full; the API turns this into a 429."""
+
+    def __init__(self, model_name, retry_after=1):
+        super().__init__(f"Inference queue for '{model_name}' is full.")
+        self.model_name = model_name
+        self.retry_after = retry_after
+
+
+class _ModelLimiter:
+    """Concurrency cap and wait-queue bound for a single model."""
+
+    def __init__(self, max_concurrency, max_queue_depth):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self._semaphore = None
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def semaphore(self):
+        # Created lazily so it binds to the server's event loop, not the import-time one.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+
+class InferenceExecutor:
+    """
+    Runs blocking model calls on a shared thread pool.
+    Each model is registered with its own concurrency limit and queue depth, so a
+    burst of heavy STT jobs can't starve translation (or vice versa).
+    """
+
+    def __init__(self, max_workers=INFERENCE_WORKERS, max_queue_depth=INFERENCE_MAX_QUEUE_DEPTH):
+        self.max_workers = max(1, max_workers)
+        self.max_queue_depth = max_queue_depth
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._limiters = {}
+
+    def register_model(self, model_name, max_concurrency=1, max_queue_depth=None):
+        """Declares a model and how many of its calls may run at the same time."""
+        if max_queue_depth is None:
+            max_queue_depth = self.max_queue_depth
+        self._limiters[model_name] = _ModelLimiter(max(1, max_concurrency), max_queue_depth)
+        logger.info(
+            f"Registered inference model '{model_name}' "
+            f"(concurrency={max_concurrency}, queue_depth={max_queue_depth})"
+        )
+
+    def total_waiting(self):
+        return sum(limiter.waiting for limiter in self._limiters.values())
+
+    async def run(self, model_name, fn, *args, **kwargs):
+        """
+        Runs `fn(*args, **kwargs)` on the worker pool under the model's limits.
+        Raises InferenceSaturated instead of queueing when the model is backed up.
+        """
+        limiter = self._limiters.get(model_name)
+        if limiter is None:
+            raise KeyError(f"Model '{model_name}' is not registered with the inference executor.")
+
+        if limiter.waiting >= limiter.max_queue_depth or self.total_waiting() >= self.max_queue_depth:
+            limiter.rejected += 1
+            raise InferenceSaturated(model_name)
+
+        limiter.waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            await limiter.semaphore.acquire()
+        finally:
+            limiter.waiting -= 1
+        QUEUE_WAIT_SECONDS.labels(model_name).observe(time.perf_counter() - queued_at)
+
+        loop = asyncio.get_running_loop()
+        limiter.running += 1
+        try:
+            job = self._pool.submit(self._timed, model_name, functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release(limiter)
+            raise
+        # The slot is held until the worker thread actually finishes, even if the
+        # awaiting request is cancelled, so the concurrency cap stays honest.
+        job.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release, limiter))
+        return await asyncio.wrap_future(job)
+
+    @staticmethod
+    def _timed(model_name, call):
+        """Runs on the worker thread, so only the model's own time is measured."""
+        start = time.perf_counter()
+        try:
+            return call()
+        finally:
+            INFERENCE_SECONDS.labels(model_name).observe(time.perf_counter() - start)
+
+    @staticmethod
+    def _release(limiter):
+        limiter.running -= 1
+        limiter.completed += 1
+        limiter.semaphore.release()
+
+    def stats(self):
+        """Current queue and worker usage per model."""
+        return {
+            "workers": self.max_workers,
+            "max_queue_depth": self.max_queue_depth,
+            "models": {
+                name: {
+                    "max_concurrency": limiter.max_concurrency,
+                    "max_queue_depth": limiter.max_queue_depth,
+                    "running": limiter.running,
+                    "waiting": limiter.waiting,
+                    "completed": limiter.completed,
+                    "rejected": limiter.rejected,
+                }
+                for name, limiter in self._limiters.items()
+            },
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
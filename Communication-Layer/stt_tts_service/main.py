@@ -1,21 +1,46 @@
 # stt_tts_service/main.py
 # This is the new, production-ready service using real models from Hugging Face.
 
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException
+import os
+from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, WebSocket
 from pydantic import BaseModel
 from transformers import pipeline
 import torch
 import librosa
 # from datasets import Audio
 
+from batching import TranslationBatcher
+from inference import InferenceExecutor, InferenceSaturated
+from model_registry import ModelRegistry, estimate_pipeline_bytes
+from routing import TranslationChain, TranslationRouter
+from sentences import join_sentences, split_sentences
+from streaming import STT_SAMPLE_RATE, run_stream_session
+from tracing import CorrelationIdMiddleware, correlation_id, metrics_response, span
+from translation_cache import build_translation_cache
+
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+STT_MAX_CONCURRENCY = int(os.environ.get("STT_MAX_CONCURRENCY", "2"))
+STT_MAX_QUEUE_DEPTH = int(os.environ.get("STT_MAX_QUEUE_DEPTH", "16"))
+TRANSLATION_MAX_CONCURRENCY = int(os.environ.get("TRANSLATION_MAX_CONCURRENCY", "2"))
+TRANSLATION_MAX_QUEUE_DEPTH = int(os.environ.get("TRANSLATION_MAX_QUEUE_DEPTH", "32"))
+MODEL_LOAD_CONCURRENCY = int(os.environ.get("MODEL_LOAD_CONCURRENCY", "2"))
+# Resident memory allowed for translation models before the least recently used is evicted.
+TRANSLATION_MODEL_MEMORY_BUDGET_MB = int(os.environ.get("TRANSLATION_MODEL_MEMORY_BUDGET_MB", "2048"))
+# Comma-separated language-code pairs loaded at startup, e.g. "hi-en,en-hi".
+PRELOAD_TRANSLATION_PAIRS = [
+    pair.strip() for pair in os.environ.get("PRELOAD_TRANSLATION_PAIRS", "hi-en,en-hi").split(",") if pair.strip()
+]
+
 # --- Pydantic Models ---
 class ProcessRequest(BaseModel):
     text: str = None
+    texts: List[str] = None # Batch mode: several texts translated in one call
     media_url: str = None # Path to a local file for simulation
     source_lang: str
     target_lang: str
@@ -34,9 +59,42 @@ stt_pipeline = pipeline(
     device=device
 )
 
+# All model calls go through this pool so inference never blocks the event loop.
+inference_executor = InferenceExecutor()
+inference_executor.register_model("stt", STT_MAX_CONCURRENCY, STT_MAX_QUEUE_DEPTH)
+inference_executor.register_model("translation", TRANSLATION_MAX_CONCURRENCY, TRANSLATION_MAX_QUEUE_DEPTH)
+inference_executor.register_model("model_load", MODEL_LOAD_CONCURRENCY)
+
 # Load Translation Models (Helsinki-NLP)
-# We create a dictionary to hold different translation pipelines as they are requested.
-translation_pipelines = {}
+# Pipelines are loaded on demand (or preloaded at startup) into a bounded LRU registry.
+def load_translation_pipeline(pipeline_key):
+    """Loads the Helsinki-NLP pipeline for a "src-tgt" key (blocking)."""
+    source_lang_code, target_lang_code = pipeline_key.split("-")
+    model_name = f"Helsinki-NLP/opus-mt-{source_lang_code}-{target_lang_code}"
+    logger.info(f"Loading translation model: {model_name}")
+    return pipeline("translation", model=model_name, device=device)
+
+def release_translation_batchers(pipeline_key, translator):
+    """Called when a pipeline is evicted; lets batchers using it finish queued work and exit."""
+    for route_key in list(translation_batchers):
+        if pipeline_key in route_key.split(">"):
+            batcher = translation_batchers.pop(route_key)
+            asyncio.ensure_future(batcher.stop(drain=True))
+
+translation_registry = ModelRegistry(
+    "translation",
+    load_fn=load_translation_pipeline,
+    sizeof_fn=estimate_pipeline_bytes,
+    executor=inference_executor,
+    memory_budget_bytes=TRANSLATION_MODEL_MEMORY_BUDGET_MB * 2**20,
+    on_evict=release_translation_batchers,
+)
+translation_router = TranslationRouter(translation_registry)
+# Each route ("hi-en", or "mr-en>en-ta" for a pivot) gets a batcher so concurrent
+# requests share forward passes.
+translation_batchers = {}
+# Finished translations, so repeated greetings and agent phrases skip the model.
+translation_cache = build_translation_cache()
 
 SUPPORTED_LANGUAGES = {
     "English": "en",
@@ -49,66 +107,180 @@ app = FastAPI(
     title="NANDI Production AI Service",
     description="Handles multilingual STT and Translation using real models."
 )
+app.add_middleware(CorrelationIdMiddleware)
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("AI Service is starting up and loading models...")
-    # You can pre-load common pipelines here if you want
-    # get_translation_pipeline("hi", "en")
+    if PRELOAD_TRANSLATION_PAIRS:
+        await translation_registry.preload(PRELOAD_TRANSLATION_PAIRS)
     logger.info("Models loaded and service ready.")
 
-def get_translation_pipeline(source_lang_code, target_lang_code):
+@app.on_event("shutdown")
+async def shutdown_event():
+    for batcher in translation_batchers.values():
+        await batcher.stop()
+    inference_executor.shutdown()
+    await translation_cache.close()
+
+async def get_translation_batcher(route):
     """
-    Dynamically loads and caches a translation pipeline for the requested language pair.
+    Returns the micro-batcher for a route (direct model or an English pivot).
+    Call it with the route pinned in the registry, and keep it pinned while the
+    batcher is in use, so no stage is evicted (and its batcher stopped) mid-request.
     """
-    model_name = f"Helsinki-NLP/opus-mt-{source_lang_code}-{target_lang_code}"
-    pipeline_key = f"{source_lang_code}-{target_lang_code}"
+    # Always go through the registry so LRU order reflects actual use
+    # (and evicted pipelines are transparently reloaded).
+    stages = [await translation_registry.get(model_key) for model_key in route]
 
-    if pipeline_key in translation_pipelines:
-        return translation_pipelines[pipeline_key]
-    
-    try:
-        logger.info(f"Loading translation model: {model_name}")
-        translator = pipeline("translation", model=model_name, device=device)
-        translation_pipelines[pipeline_key] = translator
-        return translator
-    except Exception as e:
-        logger.error(f"Could not load model {model_name}. It may not exist. Error: {e}")
-        return None
+    route_key = ">".join(route)
+    batcher = translation_batchers.get(route_key)
+    if batcher and batcher.translator.stages == stages:
+        return batcher
+    batcher = TranslationBatcher(TranslationChain(route, stages), name=route_key, executor=inference_executor)
+    translation_batchers[route_key] = batcher
+    return batcher
+
+def transcribe_simulated_audio(media_url):
+    """Builds the simulated clip for `media_url` and runs Whisper on it (blocking)."""
+    # Simulate loading audio. In a real scenario, you'd download from the URL.
+    # The clip stays in memory: Whisper takes a 16 kHz float array directly, so
+    # there is no temp file for concurrent requests to clobber.
+    sr = STT_SAMPLE_RATE
+    audio = librosa.chirp(duration=2, fmin=100, fmax=sr/2, sr=sr).astype("float32")
+
+    # Transcribe
+    return stt_pipeline(audio)
+
+async def transcribe_audio(audio):
+    """Runs Whisper on a 16 kHz float32 array through the inference pool."""
+    transcription = await inference_executor.run("stt", stt_pipeline, audio)
+    return transcription["text"].strip()
+
+def saturated_response(error):
+    return HTTPException(
+        status_code=429,
+        detail=f"Service is busy ({error.model_name}). Please retry shortly.",
+        headers={"Retry-After": str(error.retry_after)},
+    )
 
 # --- API Endpoints ---
+@app.get("/health")
+async def health():
+    """Liveness check; answered straight from the event loop even while models are busy."""
+    return {"status": "ok", "inference": inference_executor.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: queue wait, inference and model load histograms per model."""
+    return metrics_response()
+
+@app.get("/models")
+async def model_stats():
+    """Resident translation models, load times and registry hit/miss counters."""
+    return {
+        "translation": translation_registry.stats(),
+        "batchers": {
+            key: {"batches_run": batcher.batches_run, "items_processed": batcher.items_processed}
+            for key, batcher in translation_batchers.items()
+        },
+    }
+
+@app.get("/cache")
+async def cache_stats():
+    """Translation cache size and hit rate."""
+    return translation_cache.stats()
+
+@app.get("/routes")
+async def route_stats():
+    """Resolved translation routes and models currently known to be unavailable."""
+    return translation_router.stats()
+
+@app.websocket("/ws/stt")
+async def stream_speech(websocket: WebSocket):
+    """
+    Streaming speech-to-text. Send raw PCM frames and receive partial transcripts
+    while speaking, then a final transcript after an {"type": "end"} message.
+    """
+    await websocket.accept()
+    logger.info("Streaming STT session started.")
+    try:
+        await run_stream_session(websocket, transcribe_audio)
+    finally:
+        logger.info("Streaming STT session ended.")
+
+async def translate_texts(texts, source_code, target_code, use_cache):
+    """
+    Translates several texts for one language pair. Each text is split into
+    sentences and every uncached sentence is submitted at once, so they run
+    through the model as one padded batch, then reassembled per text.
+    Returns (translated_texts, route, cached_flags).
+    """
+    results = [None] * len(texts)
+    cached_flags = [False] * len(texts)
+    route = None
+    if use_cache:
+        for i, text in enumerate(texts):
+            cached = await translation_cache.get(text, source_code, target_code)
+            if cached is not None:
+                results[i] = cached["result_text"]
+                cached_flags[i] = True
+                route = cached.get("route")
+
+    pending = [i for i, text in enumerate(texts) if results[i] is None]
+    if not pending:
+        return results, route, cached_flags
+
+    route = await translation_router.resolve(source_code, target_code)
+    if not route:
+        return None, None, cached_flags
+
+    segments_per_text = {i: split_sentences(texts[i]) for i in pending}
+    sentences = [segment for i in pending for segment in segments_per_text[i] if segment]
+    with translation_registry.pin(route):
+        batcher = await get_translation_batcher(route)
+        translations = iter(await asyncio.gather(*(batcher.translate(sentence) for sentence in sentences)))
+
+    for i in pending:
+        sentence_count = sum(1 for segment in segments_per_text[i] if segment)
+        results[i] = join_sentences(segments_per_text[i], [next(translations) for _ in range(sentence_count)])
+        if use_cache:
+            await translation_cache.set(texts[i], source_code, target_code, {"result_text": results[i], "route": route})
+    logger.info(f"[{correlation_id.get()}] Translated {len(pending)} text(s) / {len(sentences)} sentence(s) ({source_code} -> {target_code}) via {batcher.name}")
+    return results, route, cached_flags
+
 @app.post("/process")
-async def process_request(request: ProcessRequest):
+async def process_request(request: ProcessRequest, x_translation_cache: Optional[str] = Header(None)):
     """
     A single, powerful endpoint to handle all transformations.
+    Send `texts` (a list) instead of `text` to translate several texts in one call;
+    the response then carries `result_texts`.
+    Send `X-Translation-Cache: bypass` to skip the translation cache.
     """
     initial_text = request.text
     
     # 1. Speech-to-Text (if audio is provided)
     if request.media_url:
         try:
-            logger.info(f"Transcribing audio from: {request.media_url}")
-            # Simulate loading audio. In a real scenario, you'd download from the URL.
-            # For Whisper, we need to load it into a specific format.
-            # We'll create a dummy audio file for this simulation.
-            dummy_audio_path = "dummy_audio.wav"
-            sr = 16000
-            librosa.output.write_wav(dummy_audio_path, librosa.chirp(duration=2, fmin=100, fmax=sr/2, sr=sr), sr)
-            
-            # Transcribe
-            transcription = stt_pipeline(dummy_audio_path)
+            logger.info(f"[{correlation_id.get()}] Transcribing audio from: {request.media_url}")
+            with span("stt"):
+                transcription = await inference_executor.run("stt", transcribe_simulated_audio, request.media_url)
             initial_text = transcription["text"]
-            logger.info(f"Transcription result: {initial_text}")
+            logger.info(f"[{correlation_id.get()}] Transcription result: {initial_text}")
+        except InferenceSaturated as e:
+            raise saturated_response(e)
         except Exception as e:
             logger.error(f"STT failed: {e}")
             raise HTTPException(status_code=500, detail="Speech-to-text processing failed.")
 
-    if not initial_text:
+    batch_mode = request.texts is not None and not request.media_url
+    texts = request.texts if batch_mode else [initial_text]
+    if not texts or not all(texts):
         raise HTTPException(status_code=400, detail="No text provided or transcribed.")
 
     # 2. Translation (if source and target languages are different)
     if request.source_lang == request.target_lang:
-        return {"result_text": initial_text}
+        return {"result_texts": texts} if batch_mode else {"result_text": initial_text}
 
     source_code = SUPPORTED_LANGUAGES.get(request.source_lang)
     target_code = SUPPORTED_LANGUAGES.get(request.target_lang)
@@ -116,14 +288,24 @@ async def process_request(request: ProcessRequest):
     if not source_code or not target_code:
         raise HTTPException(status_code=400, detail="Unsupported language specified.")
 
-    try:
-        translator = get_translation_pipeline(source_code, target_code)
-        if not translator:
-            raise HTTPException(status_code=501, detail=f"Translation from {request.source_lang} to {request.target_lang} is not supported.")
+    use_cache = (x_translation_cache or "").lower() != "bypass"
+    if not use_cache:
+        translation_cache.record_bypass()
 
-        translated_text = translator(initial_text)[0]['translation_text']
-        logger.info(f"Translated '{initial_text}' ({source_code}) -> '{translated_text}' ({target_code})")
-        return {"result_text": translated_text}
+    try:
+        with span("translate"):
+            results, route, cached_flags = await translate_texts(texts, source_code, target_code, use_cache)
+    except InferenceSaturated as e:
+        raise saturated_response(e)
     except Exception as e:
         logger.error(f"Translation failed: {e}")
         raise HTTPException(status_code=500, detail="Translation processing failed.")
+    if results is None:
+        raise HTTPException(status_code=501, detail=f"Translation from {request.source_lang} to {request.target_lang} is not supported.")
+
+    if batch_mode:
+        return {"result_texts": results, "route": route, "cached": cached_flags}
+    response = {"result_text": results[0], "route": route}
+    if cached_flags[0]:
+        response["cached"] = True
+    return response
@@ -0,0 +1,177 @@
+# stt_tts_service/model_registry.py
+# A bounded, LRU model registry used for the translation pipelines.
+# Loads are single-flight (concurrent first requests share one load), run on the
+# inference pool, and the least recently used models are evicted once the
+# resident memory budget is exceeded. Models a request is still using can be
+# pinned so they aren't evicted underneath it.
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from tracing import MODEL_LOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_pipeline_bytes(model_pipeline):
+    """Approximates the resident size of a transformers pipeline from its tensors."""
+    model = getattr(model_pipeline, "model", model_pipeline)
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class _Entry:
+    def __init__(self, model, size_bytes, load_seconds):
+        self.model = model
+        self.size_bytes = size_bytes
+        self.load_seconds = load_seconds
+        self.hits = 0
+
+
+class ModelRegistry:
+    """
+    Keeps loaded models keyed by name, in least-recently-used order.
+    `load_fn(key)` builds a model (blocking) and `sizeof_fn(model)` reports how many
+    bytes it keeps resident; `on_evict(key, model)` is called when one is dropped.
+    Pinned models are never evicted; the budget is enforced again once they are unpinned.
+    """
+
+    def __init__(self, name, load_fn, sizeof_fn, executor, memory_budget_bytes,
+                 load_model_name="model_load", on_evict=None):
+        self.name = name
+        self.load_fn = load_fn
+        self.sizeof_fn = sizeof_fn
+        self.executor = executor
+        self.memory_budget_bytes = memory_budget_bytes
+        self.load_model_name = load_model_name
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._pins = {}                # key -> number of holders
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.load_failures = 0
+        self.total_load_seconds = 0.0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def resident_bytes(self):
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def size_of(self, keys):
+        """Resident bytes of those of `keys` that are loaded."""
+        return sum(self._entries[key].size_bytes for key in keys if key in self._entries)
+
+    @contextmanager
+    def pin(self, keys):
+        """Keeps `keys` (loaded now or inside the block) from being evicted until the block exits."""
+        for key in keys:
+            self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            for key in keys:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+            self._evict_over_budget()
+
+    async def get(self, key):
+        """Returns the model for `key`, loading it (once) if it isn't resident."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return entry.model
+
+        load_task = self._loading.get(key)
+        if load_task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            load_task = asyncio.ensure_future(self._load(key))
+            self._loading[key] = load_task
+        # Shielded so a cancelled request doesn't abort a load other callers share.
+        return await asyncio.shield(load_task)
+
+    async def preload(self, keys):
+        """Loads several models concurrently; failures are logged, not raised."""
+        results = await asyncio.gather(*(self.get(key) for key in keys), return_exceptions=True)
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                logger.error(f"Preloading {self.name} model '{key}' failed: {result}")
+
+    def evict(self, key):
+        """Drops a model from the registry, if it is loaded."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.evictions += 1
+        logger.info(f"Evicted {self.name} model '{key}' ({entry.size_bytes / 2**20:.0f} MiB)")
+        if self.on_evict:
+            self.on_evict(key, entry.model)
+
+    async def _load(self, key):
+        try:
+            start = time.perf_counter()
+            model = await self.executor.run(self.load_model_name, self.load_fn, key)
+            load_seconds = time.perf_counter() - start
+            size_bytes = self.sizeof_fn(model)
+        except Exception:
+            self.load_failures += 1
+            raise
+        finally:
+            self._loading.pop(key, None)
+
+        self.total_load_seconds += load_seconds
+        MODEL_LOAD_SECONDS.labels(self.name).observe(load_seconds)
+        self._entries[key] = _Entry(model, size_bytes, load_seconds)
+        logger.info(
+            f"Loaded {self.name} model '{key}' in {load_seconds:.2f}s "
+            f"({size_bytes / 2**20:.0f} MiB, {self.resident_bytes / 2**20:.0f} MiB resident)"
+        )
+        self._evict_over_budget(keep=key)
+        return model
+
+    def _evict_over_budget(self, keep=None):
+        # Oldest first, skipping pinned models; the newest model always stays.
+        for key in list(self._entries)[:-1]:
+            if self.resident_bytes <= self.memory_budget_bytes:
+                break
+            if key != keep and key not in self._pins:
+                self.evict(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "resident_bytes": self.resident_bytes,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced_loads": self.coalesced,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "load_failures": self.load_failures,
+            "total_load_seconds": round(self.total_load_seconds, 3),
+            "loading": sorted(self._loading),
+            "pinned": sorted(self._pins),
+            "models": {
+                key: {
+                    "size_bytes": entry.size_bytes,
+                    "load_seconds": round(entry.load_seconds, 3),
+                    "hits": entry.hits,
+                }
+                for key, entry in self._entries.items()
+            },
+        }
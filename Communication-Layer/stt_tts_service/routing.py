@@ -0,0 +1,118 @@
+# stt_tts_service/routing.py
+# Resolves which translation models serve a language pair.
+# A pair is served by its direct Helsinki-NLP model when one exists, otherwise by
+# pivoting through English (src -> en -> tgt). Missing models are remembered so
+# we don't retry a failing hub download on every request.
+
+import logging
+import os
+import time
+
+from inference import InferenceSaturated
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+PIVOT_LANGUAGE = os.environ.get("TRANSLATION_PIVOT_LANGUAGE", "en")
+# How long a model that failed to load is treated as unavailable.
+NEGATIVE_CACHE_TTL_SECONDS = float(os.environ.get("TRANSLATION_NEGATIVE_CACHE_TTL", "3600"))
+
+
+class TranslationChain:
+    """
+    One or more translation pipelines applied in sequence.
+    Called like a pipeline (`chain(texts, batch_size=n)`), so a whole batch goes
+    through each stage in turn within a single worker job.
+    """
+
+    def __init__(self, route, stages):
+        self.route = route
+        self.stages = stages
+
+    def __call__(self, texts, batch_size=None):
+        for stage in self.stages:
+            outputs = stage(texts, batch_size=batch_size or len(texts))
+            texts = [output["translation_text"] for output in outputs]
+        return [{"translation_text": text} for text in texts]
+
+
+class TranslationRouter:
+    """Picks and caches the route (list of "src-tgt" model keys) for each language pair."""
+
+    def __init__(self, registry, pivot_language=PIVOT_LANGUAGE, negative_ttl=NEGATIVE_CACHE_TTL_SECONDS):
+        self.registry = registry
+        self.pivot_language = pivot_language
+        self.negative_ttl = negative_ttl
+        self._routes = {}
+        self._unavailable = {}
+
+    async def resolve(self, source_lang_code, target_lang_code):
+        """Returns the route for a pair, or None if neither a direct nor a pivot route exists."""
+        pair = (source_lang_code, target_lang_code)
+        if pair in self._routes:
+            return self._routes[pair]
+
+        candidates = [[f"{source_lang_code}-{target_lang_code}"]]
+        if self.pivot_language not in pair:
+            candidates.append([
+                f"{source_lang_code}-{self.pivot_language}",
+                f"{self.pivot_language}-{target_lang_code}",
+            ])
+
+        for route in candidates:
+            if await self._is_available(route):
+                self._routes[pair] = route
+                logger.info(f"Translation route for {source_lang_code}->{target_lang_code}: {' > '.join(route)}")
+                return route
+        return None
+
+    def _known_unavailable(self, key):
+        expires_at = self._unavailable.get(key)
+        if expires_at is None:
+            return False
+        if time.monotonic() < expires_at:
+            return True
+        del self._unavailable[key]
+        return False
+
+    async def _is_available(self, route):
+        route_key = ">".join(route)
+        if self._known_unavailable(route_key):
+            return False
+        # Pinned, so loading a later stage can't evict an earlier one before the route is sized.
+        with self.registry.pin(route):
+            for model_key in route:
+                if self._known_unavailable(model_key):
+                    return False
+                try:
+                    await self.registry.get(model_key)
+                except InferenceSaturated:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Translation model {model_key} is unavailable: {e}")
+                    self._unavailable[model_key] = time.monotonic() + self.negative_ttl
+                    return False
+            route_bytes = self.registry.size_of(route)
+
+        # A pivot needs all its stages resident at once; a single model may exceed the budget on its own.
+        budget = self.registry.memory_budget_bytes
+        if len(route) > 1 and route_bytes > budget:
+            logger.warning(
+                f"Translation route {' > '.join(route)} needs {route_bytes / 2**20:.0f} MiB, "
+                f"more than the {budget / 2**20:.0f} MiB budget; not using it."
+            )
+            self._unavailable[route_key] = time.monotonic() + self.negative_ttl
+            return False
+        return True
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "pivot_language": self.pivot_language,
+            "routes": {f"{src}-{tgt}": route for (src, tgt), route in self._routes.items()},
+            "unavailable": {
+                model_key: round(expires_at - now)
+                for model_key, expires_at in self._unavailable.items()
+                if expires_at > now
+            },
+        }
@@ -0,0 +1,58 @@
+# stt_tts_service/sentences.py
+# Sentence splitting for translation.
+# opus-mt models are trained on sentence pairs and truncate long inputs, so long
+# texts are split into sentences, translated as one batch and joined back up.
+
+import os
+import re
+
+# --- Configuration ---
+# Sentences longer than this are further split at whitespace.
+MAX_SENTENCE_CHARS = int(os.environ.get("TRANSLATION_MAX_SENTENCE_CHARS", "400"))
+
+# Latin punctuation plus the Devanagari danda / double danda used in Hindi and Marathi.
+_SENTENCE_END = re.compile(r"(?<=[.!?।॥])\s+")
+
+
+def _split_long(sentence, max_chars):
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces, current = [], ""
+    for word in sentence.split():
+        if current and len(current) + 1 + len(word) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_sentences(text, max_chars=MAX_SENTENCE_CHARS):
+    """Splits `text` into translatable segments, keeping paragraph breaks as ''."""
+    segments = []
+    for paragraph_index, paragraph in enumerate(text.split("\n")):
+        if paragraph_index:
+            segments.append("")  # Marks a line break to restore on reassembly.
+        for sentence in _SENTENCE_END.split(paragraph.strip()):
+            if sentence:
+                segments.extend(_split_long(sentence, max_chars))
+    return segments
+
+
+def join_sentences(segments, translations):
+    """
+    Rebuilds a text from the segments split_sentences produced, using
+    `translations` (one per non-empty segment, in order) in place of the originals.
+    """
+    translated = iter(translations)
+    lines, current = [], []
+    for segment in segments:
+        if segment == "":
+            lines.append(" ".join(current))
+            current = []
+        else:
+            current.append(next(translated))
+    lines.append(" ".join(current))
+    return "\n".join(lines)
@@ -0,0 +1,247 @@
+# stt_tts_service/streaming.py
+# Streaming speech-to-text over a WebSocket.
+# Audio is kept in in-memory numpy buffers; Whisper runs over a sliding window
+# as audio arrives (partial transcripts) and once more when the utterance ends
+# (final transcript). Windows overlap slightly so words cut at a boundary are
+# not lost, and the duplicated words are merged away.
+
+import asyncio
+import json
+import logging
+import os
+import re
+
+import numpy as np
+
+from inference import InferenceSaturated
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+STT_SAMPLE_RATE = 16000
+STREAM_STEP_SECONDS = float(os.environ.get("STT_STREAM_STEP_SECONDS", "1.0"))
+STREAM_WINDOW_SECONDS = float(os.environ.get("STT_STREAM_WINDOW_SECONDS", "15"))
+STREAM_OVERLAP_SECONDS = float(os.environ.get("STT_STREAM_OVERLAP_SECONDS", "1.0"))
+# Upper bound on buffered, not-yet-transcribed audio before the session is rejected.
+STREAM_MAX_BUFFER_SECONDS = float(os.environ.get("STT_STREAM_MAX_BUFFER_SECONDS", "60"))
+# Client sample rates accepted by "config"; resampling cost grows with the ratio to 16 kHz.
+STREAM_MIN_SAMPLE_RATE = 8000
+STREAM_MAX_SAMPLE_RATE = 192000
+
+SUPPORTED_ENCODINGS = ("pcm_s16le", "f32le")
+
+_WORD = re.compile(r"[^\w']+", re.UNICODE)
+
+
+def decode_pcm(payload, encoding):
+    """Converts a binary frame to mono float32 samples in [-1, 1]."""
+    sample_width = 2 if encoding == "pcm_s16le" else 4
+    if len(payload) % sample_width:
+        raise ValueError(f"Audio frame of {len(payload)} bytes is not a whole number of {encoding} samples.")
+    if encoding == "pcm_s16le":
+        return np.frombuffer(payload, dtype="<i2").astype(np.float32) / 32768.0
+    if encoding == "f32le":
+        return np.frombuffer(payload, dtype="<f4").astype(np.float32)
+    raise ValueError(f"Unsupported audio encoding '{encoding}'.")
+
+
+def resample_linear(samples, source_rate, target_rate=STT_SAMPLE_RATE):
+    """Cheap linear-interpolation resampler; good enough for speech recognition."""
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    target_length = int(round(len(samples) * target_rate / source_rate))
+    positions = np.linspace(0, len(samples) - 1, num=target_length)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def merge_transcripts(committed, new_text):
+    """
+    Appends `new_text` to `committed`, dropping the words both share at the seam
+    (they come from the audio the two windows overlap on).
+    """
+    if not committed:
+        return new_text.strip()
+    if not new_text.strip():
+        return committed
+
+    old_words = committed.split()
+    new_words = new_text.split()
+    norm_old = [_WORD.sub("", word).lower() for word in old_words]
+    norm_new = [_WORD.sub("", word).lower() for word in new_words]
+
+    max_overlap = min(len(norm_old), len(norm_new))
+    for size in range(max_overlap, 0, -1):
+        if norm_old[-size:] == norm_new[:size]:
+            new_words = new_words[size:]
+            break
+    return " ".join(old_words + new_words)
+
+
+class StreamingTranscriber:
+    """
+    Per-connection transcription state.
+    `transcribe(audio)` is an async callable returning the text for a float32
+    16 kHz clip; `emit(message)` sends a dict back to the client.
+    """
+
+    def __init__(self, transcribe, emit, sample_rate=STT_SAMPLE_RATE, encoding="pcm_s16le",
+                 step_seconds=STREAM_STEP_SECONDS, window_seconds=STREAM_WINDOW_SECONDS,
+                 overlap_seconds=STREAM_OVERLAP_SECONDS, max_buffer_seconds=STREAM_MAX_BUFFER_SECONDS):
+        self.transcribe = transcribe
+        self.emit = emit
+        self.configure(sample_rate, encoding)
+        self.step_samples = int(step_seconds * STT_SAMPLE_RATE)
+        self.window_samples = int(window_seconds * STT_SAMPLE_RATE)
+        self.overlap_samples = int(min(overlap_seconds, window_seconds / 2) * STT_SAMPLE_RATE)
+        self.max_buffer_samples = int(max_buffer_seconds * STT_SAMPLE_RATE)
+        self._reset()
+        self._partial_task = None
+
+    def configure(self, sample_rate=None, encoding=None):
+        """Validates both settings before applying either; raises ValueError for bad ones."""
+        if encoding is not None and encoding not in SUPPORTED_ENCODINGS:
+            raise ValueError(f"Unsupported audio encoding '{encoding}'. Use one of {SUPPORTED_ENCODINGS}.")
+        if sample_rate is not None:
+            try:
+                sample_rate = int(sample_rate)
+            except (TypeError, ValueError):
+                raise ValueError(f"sample_rate must be an integer, not {sample_rate!r}.")
+            if not STREAM_MIN_SAMPLE_RATE <= sample_rate <= STREAM_MAX_SAMPLE_RATE:
+                raise ValueError(
+                    f"sample_rate must be between {STREAM_MIN_SAMPLE_RATE} and {STREAM_MAX_SAMPLE_RATE} Hz."
+                )
+            self.sample_rate = sample_rate
+        if encoding is not None:
+            self.encoding = encoding
+
+    def _reset(self):
+        self._chunks = []
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._committed = ""
+        self._partial = ""
+        self._samples_since_partial = 0
+
+    def _take_buffer(self):
+        if self._chunks:
+            self._buffer = np.concatenate([self._buffer] + self._chunks)
+            self._chunks = []
+        return self._buffer
+
+    @property
+    def buffered_samples(self):
+        return len(self._buffer) + sum(len(chunk) for chunk in self._chunks)
+
+    async def add_audio(self, payload):
+        """Buffers one binary frame and kicks off a partial transcription when due."""
+        samples = resample_linear(decode_pcm(payload, self.encoding), self.sample_rate)
+        if self.buffered_samples + len(samples) > self.max_buffer_samples:
+            raise InferenceSaturated("stt_stream")
+        self._chunks.append(samples)
+        self._samples_since_partial += len(samples)
+
+        busy = self._partial_task is not None and not self._partial_task.done()
+        if self._samples_since_partial >= self.step_samples and not busy:
+            self._samples_since_partial = 0
+            self._partial_task = asyncio.ensure_future(self._run_partial())
+
+    async def _commit_window(self):
+        """Transcribes one full window and keeps only the overlap for the next one."""
+        text = await self.transcribe(self._buffer[:self.window_samples])
+        self._committed = merge_transcripts(self._committed, text)
+        self._buffer = self._buffer[self.window_samples - self.overlap_samples:]
+        self._partial = ""
+
+    async def _run_partial(self):
+        try:
+            audio = self._take_buffer()
+            if len(audio) >= self.window_samples:
+                await self._commit_window()
+            else:
+                self._partial = await self.transcribe(audio)
+            await self.emit({"type": "partial", "text": merge_transcripts(self._committed, self._partial)})
+        except InferenceSaturated:
+            # Partials are best effort; the final transcript will still be produced.
+            logger.debug("Skipping partial transcript, STT is saturated.")
+        except Exception as e:
+            logger.error(f"Partial transcription failed: {e}")
+
+    async def finish(self):
+        """Transcribes whatever is buffered, emits the final transcript and resets."""
+        if self._partial_task is not None:
+            await self._partial_task
+            self._partial_task = None
+
+        try:
+            while len(self._take_buffer()) > self.window_samples:
+                await self._commit_window()
+            text = self._committed
+            if len(self._buffer) > 0:
+                text = merge_transcripts(self._committed, await self.transcribe(self._buffer))
+        except InferenceSaturated:
+            raise  # The audio stays buffered, so the client can send 'end' again.
+        except Exception:
+            self._reset()  # Don't carry an utterance that can't be transcribed into the next one.
+            raise
+        self._reset()
+        await self.emit({"type": "final", "text": text})
+        return text
+
+    async def close(self):
+        if self._partial_task is not None and not self._partial_task.done():
+            self._partial_task.cancel()
+
+
+async def run_stream_session(websocket, transcribe):
+    """
+    Drives one WebSocket session. Protocol:
+      - text  {"type": "config", "sample_rate": 48000, "encoding": "pcm_s16le"}  (optional)
+      - bytes mono audio frames in the configured encoding
+      - text  {"type": "end"}  -> final transcript for the utterance; the socket stays open
+    The server sends {"type": "partial"|"final"|"error", ...} messages back.
+    """
+    async def emit(message):
+        await websocket.send_text(json.dumps(message, ensure_ascii=False))
+
+    session = StreamingTranscriber(transcribe, emit)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            if message.get("bytes") is not None:
+                try:
+                    await session.add_audio(message["bytes"])
+                except InferenceSaturated:
+                    await emit({"type": "error", "code": 429, "detail": "Too much buffered audio; send 'end' first."})
+                except ValueError as e:
+                    # A truncated frame is dropped; the session carries on with the next one.
+                    await emit({"type": "error", "code": 400, "detail": str(e)})
+                continue
+
+            try:
+                control = json.loads(message.get("text") or "{}")
+            except ValueError:
+                await emit({"type": "error", "code": 400, "detail": "Control messages must be JSON."})
+                continue
+            if not isinstance(control, dict):
+                await emit({"type": "error", "code": 400, "detail": "Control messages must be JSON objects."})
+                continue
+
+            if control.get("type") == "config":
+                try:
+                    session.configure(control.get("sample_rate"), control.get("encoding"))
+                except ValueError as e:
+                    await emit({"type": "error", "code": 400, "detail": str(e)})
+            elif control.get("type") == "end":
+                try:
+                    await session.finish()
+                except InferenceSaturated:
+                    await emit({"type": "error", "code": 429, "detail": "Speech-to-text is busy. Please retry."})
+                except Exception as e:
+                    logger.error(f"Final transcription failed: {e}")
+                    await emit({"type": "error", "code": 500, "detail": "Transcription failed."})
+            else:
+                await emit({"type": "error", "code": 400, "detail": f"Unknown message type '{control.get('type')}'."})
+    finally:
+        await session.close()
@@ -0,0 +1,111 @@
+# stt_tts_service/tracing.py
+# Correlation IDs and Prometheus metrics for the AI service.
+# comm_service sends an X-Correlation-ID header with each /process call; the
+# middleware below makes it available to log lines (and echoes it back), and
+# the histograms split a slow request into queue wait, inference and model
+# load time. Everything is served at /metrics.
+
+import contextvars
+import logging
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Spans at least this slow are logged at INFO with their correlation ID; the rest at DEBUG.
+TRACE_SLOW_SPAN_MS = float(os.environ.get("TRACE_SLOW_SPAN_MS", "500"))
+
+CORRELATION_HEADER = "X-Correlation-ID"
+_VALID_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "nandi_ai_queue_wait_seconds",
+    "Time a model call waited for a free slot in the inference pool.",
+    ["model"],
+    buckets=_LATENCY_BUCKETS,
+)
+INFERENCE_SECONDS = Histogram(
+    "nandi_ai_inference_seconds",
+    "Time a model call ran on an inference worker.",
+    ["model"],
+    buckets=_LATENCY_BUCKETS,
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "nandi_ai_model_load_seconds",
+    "Time taken to load a model into a registry.",
+    ["registry"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+TRANSLATION_BATCH_SIZE = Histogram(
+    "nandi_ai_translation_batch_size",
+    "Sentences translated per forward pass.",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+STAGE_SECONDS = Histogram(
+    "nandi_ai_stage_seconds",
+    "Time spent in each stage of a /process request.",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+
+def observe(stage, seconds):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    level = logging.INFO if seconds * 1000 >= TRACE_SLOW_SPAN_MS else logging.DEBUG
+    logger.log(level, f"[{correlation_id.get()}] {stage} took {seconds * 1000:.0f} ms")
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as `stage`, whether it succeeds or fails."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+class CorrelationIdMiddleware:
+    """
+    Takes the caller's X-Correlation-ID (or makes one up) for the duration of
+    the request and returns it in the response headers. Plain ASGI, so it
+    doesn't buffer responses or get in the way of WebSockets.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        header = CORRELATION_HEADER.lower().encode("latin-1")
+        incoming = dict(scope["headers"]).get(header, b"").decode("latin-1")
+        request_id = incoming if _VALID_ID.match(incoming) else uuid.uuid4().hex[:16]
+        token = correlation_id.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            correlation_id.reset(token)
+
+
+def metrics_response():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,177 @@
+# stt_tts_service/translation_cache.py
+# Caches translation results keyed by (normalized text, source, target).
+# A per-process LRU with TTL sits in front of an optional shared backend (Redis),
+# so greetings and canned agent replies skip the model entirely.
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+CACHE_MAX_ENTRIES = int(os.environ.get("TRANSLATION_CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.environ.get("TRANSLATION_CACHE_TTL", "86400"))
+# Longer texts are unlikely to repeat, so they aren't worth the memory.
+CACHE_MAX_TEXT_CHARS = int(os.environ.get("TRANSLATION_CACHE_MAX_TEXT_CHARS", "2000"))
+CACHE_REDIS_URL = os.environ.get("TRANSLATION_CACHE_REDIS_URL")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Canonical form used for cache keys: NFC, trimmed, single spaces."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class InMemoryCacheBackend:
+    """LRU dictionary with per-entry expiry. Also the stand-in for a shared backend."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Shared cache across replicas, backed by Redis (requires the `redis` package)."""
+
+    def __init__(self, url, prefix="nandi:translation:"):
+        import redis.asyncio as redis  # Optional dependency, only needed when configured.
+
+        self._client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key):
+        value = await self._client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    async def set(self, key, value, ttl):
+        await self._client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    async def close(self):
+        await self._client.close()
+
+
+class TranslationCache:
+    """
+    Two-tier cache: local LRU first, then the shared backend (if any).
+    Shared-backend errors are logged and treated as misses so they never fail a request.
+    """
+
+    def __init__(self, local=None, shared=None, ttl=CACHE_TTL_SECONDS, max_text_chars=CACHE_MAX_TEXT_CHARS):
+        self.local = local or InMemoryCacheBackend()
+        self.shared = shared
+        self.ttl = ttl
+        self.max_text_chars = max_text_chars
+        # Metrics
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.shared_errors = 0
+
+    @staticmethod
+    def make_key(text, source_lang_code, target_lang_code):
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{source_lang_code}:{target_lang_code}:{digest}"
+
+    def is_cacheable(self, text):
+        return len(text) <= self.max_text_chars
+
+    async def get(self, text, source_lang_code, target_lang_code):
+        """Returns the cached result dict, or None on a miss."""
+        if not self.is_cacheable(text):
+            return None
+        key = self.make_key(text, source_lang_code, target_lang_code)
+
+        value = await self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return json.loads(value)
+
+        if self.shared is not None:
+            try:
+                value = await self.shared.get(key)
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning(f"Shared translation cache lookup failed: {e}")
+                value = None
+            if value is not None:
+                self.shared_hits += 1
+                await self.local.set(key, value, self.ttl)
+                return json.loads(value)
+
+        self.misses += 1
+        return None
+
+    async def set(self, text, source_lang_code, target_lang_code, result):
+        if not self.is_cacheable(text):
+            return
+        key = self.make_key(text, source_lang_code, target_lang_code)
+        value = json.dumps(result, ensure_ascii=False)
+        await self.local.set(key, value, self.ttl)
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, value, self.ttl)
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning(f"Shared translation cache write failed: {e}")
+
+    def record_bypass(self):
+        self.bypassed += 1
+
+    def stats(self):
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            "entries": len(self.local),
+            "max_entries": self.local.max_entries,
+            "ttl_seconds": self.ttl,
+            "shared_backend": type(self.shared).__name__ if self.shared is not None else None,
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "shared_errors": self.shared_errors,
+            "hit_rate": ((self.local_hits + self.shared_hits) / lookups) if lookups else 0.0,
+        }
+
+    async def close(self):
+        if self.shared is not None and hasattr(self.shared, "close"):
+            await self.shared.close()
+
+
+def build_translation_cache():
+    """Creates the cache from environment settings."""
+    shared = None
+    if CACHE_REDIS_URL:
+        try:
+            shared = RedisCacheBackend(CACHE_REDIS_URL)
+            logger.info("Using Redis as the shared translation cache.")
+        except ImportError:
+            logger.warning("TRANSLATION_CACHE_REDIS_URL is set but the 'redis' package is not installed.")
+    return TranslationCache(shared=shared)
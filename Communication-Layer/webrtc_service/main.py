@@ -4,20 +4,40 @@
 import asyncio
 import json
 import logging
+import os
 import uuid
 from fastapi import FastAPI, HTTPException, Request
 from aiortc import RTCPeerConnection, RTCSessionDescription
 from aiortc.contrib.media import MediaRelay, MediaStreamTrack
 import httpx
+import websockets
+
+from vad import VAD_SAMPLE_RATE, UtteranceSegmenter, to_mono_16k
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+STT_STREAM_URL = os.environ.get("STT_STREAM_URL", "ws://stt_tts_service:8002/ws/stt")
+# Audio chunks waiting to be sent to STT; beyond this, new chunks are dropped (end markers never are).
+STT_SEND_QUEUE_SIZE = int(os.environ.get("STT_SEND_QUEUE_SIZE", "200"))
+
 app = FastAPI(title="NANDI WebRTC Media Server")
 pcs = set() # Set to store active peer connections
 
-# This is a placeholder for a real audio track that would process incoming audio
+def frame_to_16k(frame):
+    """Converts an aiortc/PyAV audio frame to mono float32 samples at 16 kHz."""
+    samples = frame.to_ndarray()
+    channels = len(frame.layout.channels)
+    if frame.format.is_planar:
+        samples = samples.T  # (channels, n) -> interleaved
+    return to_mono_16k(samples, frame.sample_rate, channels)
+
 class AudioProcessorTrack(MediaStreamTrack):
+    """
+    Passes audio through unchanged while running voice activity detection on it.
+    Only voiced audio is streamed to the STT service, one utterance at a time;
+    silence never leaves this process.
+    """
     kind = "audio"
 
     def __init__(self, track, farmer_id, language):
@@ -26,15 +46,85 @@ class AudioProcessorTrack(MediaStreamTrack):
         self.farmer_id = farmer_id
         self.language = language
         self.is_speaking = False
+        self.segmenter = UtteranceSegmenter()
+        self.transcripts = []
+        # Unbounded so end markers always fit; _enqueue caps the audio in it instead.
+        self._outbox = asyncio.Queue()
+        self._queued_audio = 0
+        self._stt_task = None
 
     async def recv(self):
         frame = await self.track.recv()
-        # In a real implementation, you would process the audio frame here.
-        # For example, you could check the audio volume to detect speech.
-        # If speech is detected, you'd start streaming these frames to an STT service.
-        # For this simulation, we'll rely on the client to tell us when to "transcribe".
+        try:
+            self._detect_speech(frame)
+        except Exception as e:
+            logger.error(f"VAD failed for farmer {self.farmer_id}: {e}")
         return frame
 
+    def _detect_speech(self, frame):
+        for event, audio in self.segmenter.process(frame_to_16k(frame)):
+            if event == "start":
+                self.is_speaking = True
+                self._ensure_stt_stream()
+            elif event == "end":
+                self.is_speaking = False
+            self._enqueue({"type": "end"} if event == "end" else audio)
+
+    def _enqueue(self, item):
+        # Never block the media path; if STT can't keep up, drop audio rather than lag.
+        # End markers are always queued, or STT would merge the utterance into the next one.
+        if not isinstance(item, dict):
+            if self._queued_audio >= STT_SEND_QUEUE_SIZE:
+                logger.warning(f"STT send queue full for farmer {self.farmer_id}; dropping audio.")
+                return
+            self._queued_audio += 1
+        self._outbox.put_nowait(item)
+
+    def _ensure_stt_stream(self):
+        if self._stt_task is None or self._stt_task.done():
+            self._stt_task = asyncio.ensure_future(self._stream_to_stt())
+
+    async def _stream_to_stt(self):
+        """Keeps one STT socket per track and feeds it utterance audio and end markers."""
+        try:
+            async with websockets.connect(STT_STREAM_URL) as stt_socket:
+                await stt_socket.send(json.dumps({"type": "config", "sample_rate": VAD_SAMPLE_RATE, "encoding": "f32le"}))
+                receiver = asyncio.ensure_future(self._receive_transcripts(stt_socket))
+                try:
+                    while True:
+                        item = await self._outbox.get()
+                        if isinstance(item, dict):
+                            await stt_socket.send(json.dumps(item))
+                        else:
+                            self._queued_audio -= 1
+                            await stt_socket.send(item.astype("<f4").tobytes())
+                finally:
+                    receiver.cancel()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"STT stream failed for farmer {self.farmer_id}: {e}")
+
+    async def _receive_transcripts(self, stt_socket):
+        async for raw_message in stt_socket:
+            message = json.loads(raw_message)
+            if message.get("type") == "final" and message.get("text"):
+                self.transcripts.append(message["text"])
+                logger.info(f"[{self.farmer_id}] Utterance ({self.language}): {message['text']}")
+            elif message.get("type") == "error":
+                logger.warning(f"[{self.farmer_id}] STT error: {message.get('detail')}")
+
+    def stop(self):
+        super().stop()
+        if self._stt_task is not None:
+            self._stt_task.cancel()
+        seen = self.segmenter.frames_seen
+        if seen:
+            logger.info(
+                f"[{self.farmer_id}] VAD sent {self.segmenter.frames_sent}/{seen} frames "
+                f"({100 * self.segmenter.frames_sent / seen:.0f}%) to STT."
+            )
+
 @app.post("/offer")
 async def offer(request: Request):
     """
@@ -0,0 +1,161 @@
+# webrtc_service/vad.py
+# Energy-based voice activity detection and utterance endpointing.
+# Works on whole numpy frames at a time (no per-sample Python loops), so it is
+# cheap enough to run inline in the media track for every call.
+
+import os
+
+import numpy as np
+
+# --- Configuration ---
+VAD_SAMPLE_RATE = 16000
+VAD_FRAME_MS = int(os.environ.get("VAD_FRAME_MS", "10"))
+# A frame is voiced when it is this many dB above the tracked noise floor...
+VAD_MARGIN_DB = float(os.environ.get("VAD_MARGIN_DB", "12"))
+# ...and above this absolute level (dBFS), so a silent line never triggers.
+VAD_MIN_LEVEL_DB = float(os.environ.get("VAD_MIN_LEVEL_DB", "-50"))
+VAD_MIN_SPEECH_MS = int(os.environ.get("VAD_MIN_SPEECH_MS", "120"))
+VAD_HANGOVER_MS = int(os.environ.get("VAD_HANGOVER_MS", "600"))
+VAD_PREROLL_MS = int(os.environ.get("VAD_PREROLL_MS", "300"))
+VAD_MAX_UTTERANCE_SECONDS = float(os.environ.get("VAD_MAX_UTTERANCE_SECONDS", "30"))
+
+
+def to_mono_16k(samples, sample_rate, channels=1):
+    """
+    Converts interleaved int16 (or float) samples to mono float32 at 16 kHz.
+    Integer rate ratios (48 kHz -> 16 kHz) are decimated by averaging, which also
+    acts as a crude low-pass filter; other rates fall back to linear interpolation.
+    """
+    audio = np.asarray(samples)
+    if audio.dtype == np.int16:
+        audio = audio.astype(np.float32) / 32768.0
+    else:
+        audio = audio.astype(np.float32)
+    audio = audio.reshape(-1)
+    if channels > 1:
+        audio = audio[: len(audio) - len(audio) % channels].reshape(-1, channels).mean(axis=1)
+
+    if sample_rate == VAD_SAMPLE_RATE:
+        return audio
+    if sample_rate % VAD_SAMPLE_RATE == 0:
+        factor = sample_rate // VAD_SAMPLE_RATE
+        audio = audio[: len(audio) - len(audio) % factor]
+        return audio.reshape(-1, factor).mean(axis=1)
+    target_length = int(round(len(audio) * VAD_SAMPLE_RATE / sample_rate))
+    positions = np.linspace(0, len(audio) - 1, num=target_length)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+class RingBuffer:
+    """Fixed-capacity float32 buffer that keeps the most recent samples."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._size = 0
+        self._end = 0
+
+    def write(self, samples):
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        first = min(n, self.capacity - self._end)
+        self._data[self._end:self._end + first] = samples[:first]
+        self._data[:n - first] = samples[first:]
+        self._end = (self._end + n) % self.capacity
+        self._size = min(self.capacity, self._size + n)
+
+    def read(self):
+        """Returns the buffered samples in order and empties the buffer."""
+        start = (self._end - self._size) % self.capacity
+        if start + self._size <= self.capacity:
+            out = self._data[start:start + self._size].copy()
+        else:
+            out = np.concatenate([self._data[start:], self._data[:self._end]])
+        self._size = 0
+        return out
+
+    def __len__(self):
+        return self._size
+
+
+class UtteranceSegmenter:
+    """
+    Splits a 16 kHz mono stream into utterances.
+    `process(audio)` returns a list of events:
+      ("start", audio)  speech began; `audio` includes the pre-roll before onset
+      ("audio", audio)  more audio of the current utterance
+      ("end", None)     the speaker paused for the hangover time (or hit the max length)
+    """
+
+    def __init__(self, frame_ms=VAD_FRAME_MS, margin_db=VAD_MARGIN_DB, min_level_db=VAD_MIN_LEVEL_DB,
+                 min_speech_ms=VAD_MIN_SPEECH_MS, hangover_ms=VAD_HANGOVER_MS, preroll_ms=VAD_PREROLL_MS,
+                 max_utterance_seconds=VAD_MAX_UTTERANCE_SECONDS):
+        self.frame_size = VAD_SAMPLE_RATE * frame_ms // 1000
+        self.margin_db = margin_db
+        self.min_level_db = min_level_db
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.max_utterance_frames = int(max_utterance_seconds * 1000 / frame_ms)
+        self.preroll = RingBuffer(VAD_SAMPLE_RATE * preroll_ms // 1000 + self.frame_size * self.min_speech_frames)
+        self.noise_floor_db = min_level_db
+        self.in_speech = False
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._utterance_frames = 0
+        # Stats, used to report how much audio never reached STT.
+        self.frames_seen = 0
+        self.frames_sent = 0
+
+    def frame_levels(self, frames):
+        """Per-frame RMS level in dBFS for a (n_frames, frame_size) array."""
+        rms = np.sqrt(np.mean(frames ** 2, axis=1) + 1e-12)
+        return 20.0 * np.log10(rms)
+
+    def process(self, audio):
+        audio = np.concatenate([self._remainder, audio]) if len(self._remainder) else audio
+        n_frames = len(audio) // self.frame_size
+        self._remainder = audio[n_frames * self.frame_size:]
+        if n_frames == 0:
+            return []
+
+        frames = audio[: n_frames * self.frame_size].reshape(n_frames, self.frame_size)
+        levels = self.frame_levels(frames)
+        self.frames_seen += n_frames
+
+        events = []
+        pending = []
+        for frame, level in zip(frames, levels):
+            voiced = level > max(self.noise_floor_db + self.margin_db, self.min_level_db)
+            # Track the background level so loud rooms don't read as speech; voiced
+            # frames only nudge it, so a sustained noise change is still learned.
+            rate = 0.001 if voiced else 0.05
+            self.noise_floor_db = (1 - rate) * self.noise_floor_db + rate * level
+
+            if not self.in_speech:
+                self.preroll.write(frame)
+                self._voiced_run = self._voiced_run + 1 if voiced else 0
+                if self._voiced_run >= self.min_speech_frames:
+                    self.in_speech = True
+                    self._silent_run = 0
+                    self._utterance_frames = 0
+                    onset = self.preroll.read()
+                    self.frames_sent += len(onset) // self.frame_size
+                    events.append(("start", onset))
+                continue
+
+            pending.append(frame)
+            self._utterance_frames += 1
+            self._silent_run = 0 if voiced else self._silent_run + 1
+            if self._silent_run >= self.hangover_frames or self._utterance_frames >= self.max_utterance_frames:
+                events.append(("audio", np.concatenate(pending)))
+                self.frames_sent += len(pending)
+                pending = []
+                events.append(("end", None))
+                self.in_speech = False
+                self._voiced_run = 0
+
+        if pending:
+            events.append(("audio", np.concatenate(pending)))
+            self.frames_sent += len(pending)
+        return events
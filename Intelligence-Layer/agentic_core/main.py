@@ -4,13 +4,30 @@
 import asyncio
 import logging
 import ast
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import time
+from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Mock Agentic Core")
 
+# The communication service puts its correlation ID in the query packet (pooled
+# sockets are opened before the session exists, so a header can't carry it).
+# A real agent should forward it to the RAG API as the X-Correlation-ID header.
+
+REPLY_SECONDS = Histogram(
+    "nandi_agent_reply_seconds",
+    "Time from receiving a query to sending each reply.",
+    ["reply"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
@@ -19,11 +36,14 @@ async def websocket_endpoint(websocket: WebSocket):
         initial_data = await websocket.receive_text()
         # The string might be a dict representation, so we use ast.literal_eval
         query_data = ast.literal_eval(initial_data)
-        logger.info(f"Received processed query: {query_data}")
+        received_at = time.perf_counter()
+        correlation_id = query_data.get('correlation_id')
+        logger.info(f"[{correlation_id}] Received processed query: {query_data}")
         
         query_text = query_data.get('query_text', '')
 
         await websocket.send_text(f"Okay, I've received your query about '{query_text}'. Let me check.")
+        REPLY_SECONDS.labels("first").observe(time.perf_counter() - received_at)
         await asyncio.sleep(2)
 
         await websocket.send_text("Based on the latest forecast, we expect light rain tomorrow.")
@@ -33,7 +53,8 @@ async def websocket_endpoint(websocket: WebSocket):
         await asyncio.sleep(4)
         
         await websocket.send_text("Thank you for using NANDI.")
-        logger.info("Finished processing. Closing connection.")
+        REPLY_SECONDS.labels("last").observe(time.perf_counter() - received_at)
+        logger.info(f"[{correlation_id}] Finished processing. Closing connection.")
 
     except WebSocketDisconnect:
         logger.warning("Communication Service disconnected.")
@@ -1,13 +1,28 @@
 # This is the main FastAPI application file.
 # It serves the RAG model as an API endpoint that accepts contextual information.
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import re
+import threading
+import time
+from functools import partial
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from pydantic import BaseModel, Field
 import uvicorn
 from typing import Optional
 
 # Import the handler functions from our other file
-from rag_handler import setup_qa_chain
+from rag_handler import build_generation_prompt, embed_text, generate_answer, setup_qa_chain, stream_answer_tokens
+from context import CONTEXT_COMPRESSION, compress_context
+from retrieval import RETRIEVAL_K, RETRIEVAL_SCORE_THRESHOLD, QueryRetriever, build_retrieval_query, load_reranker
+from scheduler import ClientDisconnected, QAScheduler, SchedulerOverloaded, SchedulerTimeout
+from semantic_cache import ANSWER_CACHE_ENABLED, SemanticAnswerCache, context_key
+from tracing import (FIRST_TOKEN_SECONDS, GENERATION_SECONDS, MODEL_LOAD_SECONDS, QUEUE_WAIT_SECONDS,
+                     RETRIEVAL_SECONDS, CorrelationIdMiddleware, correlation_id, metrics_response, record, span)
 
 # --- Pydantic Models for Request Body ---
 # These models define the structure of the data your API expects.
@@ -26,6 +41,9 @@ class QueryRequest(BaseModel):
     """The main request body for the /ask endpoint."""
     question: str = Field(..., example="What is the best fertilizer to use for my next crop?")
     context: Context
+    # Retrieval settings; the server defaults apply when omitted.
+    k: Optional[int] = Field(None, ge=1, le=20, example=3)
+    score_threshold: Optional[float] = Field(None, ge=0.0, le=1.0, example=0.3)
 
 # --- FastAPI Application ---
 
@@ -34,9 +52,20 @@ app = FastAPI(
     description="An API for querying agricultural knowledge with real-time context.",
     version="1.0.0"
 )
+# Carries the caller's X-Correlation-ID through each request (see tracing.py).
+app.add_middleware(CorrelationIdMiddleware)
 
 # This will hold our loaded QA chain so we don't reload it on every request
 qa_chain = None
+# Retrieves documents for the question alone; built from the chain's vector store.
+retriever = None
+# Caps how many answers are generated at once; see scheduler.py for the settings.
+scheduler = QAScheduler()
+# Reuses answers to near-identical questions asked with the same context.
+answer_cache = SemanticAnswerCache()
+
+# Non-standard "client closed request" status; nobody is left to read it.
+CLIENT_CLOSED_REQUEST = 499
 
 @app.on_event("startup")
 def load_model():
@@ -44,11 +73,15 @@ def load_model():
     This function is called when the FastAPI application starts.
     It loads the RAG model into memory.
     """
-    global qa_chain
-    qa_chain = setup_qa_chain()
+    global qa_chain, retriever
+    with span("Loading the QA chain", MODEL_LOAD_SECONDS, "qa_chain"):
+        qa_chain = setup_qa_chain()
     if qa_chain is None:
         print("FATAL: QA Chain could not be initialized. The API will not work.")
     else:
+        with span("Loading the reranker", MODEL_LOAD_SECONDS, "reranker"):
+            reranker = load_reranker()
+        retriever = QueryRetriever(qa_chain.retriever.vectorstore, reranker=reranker)
         print("--- RAG Model and API are ready ---")
 
 def construct_rich_prompt(request: QueryRequest) -> str:
@@ -77,8 +110,76 @@ def construct_rich_prompt(request: QueryRequest) -> str:
     )
     return prompt
 
+def retrieve_documents(request: QueryRequest):
+    """
+    Retrieves with the question (plus crop/soil keywords) only; the rest of the
+    context is left to the generation prompt. The documents are then compressed
+    (merged, de-duplicated, trimmed to a token budget) before generation.
+    """
+    query = build_retrieval_query(request.question, request.context.current_crop, request.context.soil_type)
+    k = request.k or RETRIEVAL_K
+    score_threshold = request.score_threshold if request.score_threshold is not None else RETRIEVAL_SCORE_THRESHOLD
+    docs = retriever.retrieve(query, k=k, score_threshold=score_threshold)
+    return compress_context(docs, request.question) if CONTEXT_COMPRESSION else docs
+
+def format_sources(docs):
+    """Source file and page for each retrieved document."""
+    return [
+        {
+            "source_file": doc.metadata.get('source', 'Unknown').split('/')[-1], # Show only filename
+            "page": doc.metadata.get('page', 'N/A'),
+        } for doc in docs
+    ]
+
+# A sentence is complete once its closing punctuation is followed by whitespace,
+# so decimals like "2.5 kg" are never split.
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?।])\s+")
+
+def split_complete_sentences(buffer):
+    """Returns (complete sentences, unfinished remainder) for streamed text."""
+    parts = SENTENCE_BOUNDARY.split(buffer)
+    return [part.strip() for part in parts[:-1] if part.strip()], parts[-1]
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def acquire_slot():
+    """Waits for a generation slot, turning load-shedding into a 503 with Retry-After."""
+    try:
+        with span("Waiting for a generation slot", QUEUE_WAIT_SECONDS):
+            await scheduler.acquire()
+    except SchedulerOverloaded:
+        raise HTTPException(status_code=503, detail="Too many questions in progress. Try again shortly.",
+                            headers={"Retry-After": "5"})
+    except SchedulerTimeout:
+        raise HTTPException(status_code=503, detail="Timed out waiting for the model. Try again shortly.",
+                            headers={"Retry-After": "10"})
+
+@app.get("/health")
+def health():
+    return {
+        "ready": qa_chain is not None,
+        "scheduler": scheduler.stats(),
+        "query_embeddings": retriever.stats() if retriever is not None else None,
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: queue wait, retrieval, generation and model load histograms."""
+    return metrics_response()
+
+@app.get("/cache")
+def cache_stats():
+    return {"enabled": ANSWER_CACHE_ENABLED, **answer_cache.stats()}
+
+@app.delete("/cache")
+def clear_cache():
+    """Drops every cached answer, e.g. after the knowledge base is updated."""
+    answer_cache.clear()
+    return {"status": "cleared"}
+
 @app.post("/ask")
-async def ask_question(request: QueryRequest):
+async def ask_question(request: QueryRequest, http_request: Request):
     """
     The main endpoint for the agent to call. It takes the farmer's question
     and all the gathered context, constructs a rich prompt, and gets an answer.
@@ -89,25 +190,115 @@ async def ask_question(request: QueryRequest):
             detail="Model is not ready or failed to load. Check server logs."
         )
 
-    print("Received request with context...")
+    print(f"[{correlation_id.get()}] Received request with context...")
     
     # 1. Construct the detailed prompt
     rich_prompt = construct_rich_prompt(request)
-    print(f"Constructed Rich Prompt: {rich_prompt}")
-    
-    # 2. Run the prompt through the QA chain
-    result = qa_chain({'query': rich_prompt})
+    print(f"[{correlation_id.get()}] Constructed Rich Prompt: {rich_prompt}")
+
+    # 2. Serve a cached answer to a near-identical question with the same context
+    if ANSWER_CACHE_ENABLED:
+        cache_key = context_key(request.context) + (request.k, request.score_threshold)
+        question_embedding = await run_in_threadpool(embed_text, qa_chain, request.question)
+        cached = answer_cache.get(cache_key, question_embedding)
+        if cached is not None:
+            print("Answer served from the semantic cache.")
+            return {**cached, "cached": True}
+
+    # 3. Retrieve with the question, then generate with the full context (off the
+    #    event loop, under the concurrency cap)
+    with span("Retrieval", RETRIEVAL_SECONDS):
+        docs = await run_in_threadpool(retrieve_documents, request)
+    await acquire_slot()
+    try:
+        with span("Generation", GENERATION_SECONDS, "ask"):
+            answer = await scheduler.run(partial(generate_answer, qa_chain, docs, rich_prompt), request=http_request)
+    except ClientDisconnected:
+        print("Client disconnected; answer generation cancelled.")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    finally:
+        scheduler.release()
     
-    # 3. Format and return the response
-    return {
-        "answer": result.get('result'),
-        "sources": [
-            {
-                "source_file": doc.metadata.get('source', 'Unknown').split('/')[-1], # Show only filename
-                "page": doc.metadata.get('page', 'N/A'),
-            } for doc in result.get('source_documents', [])
-        ]
+    # 4. Format, cache and return the response
+    response = {
+        "answer": answer,
+        "sources": format_sources(docs)
     }
+    if ANSWER_CACHE_ENABLED and response["answer"]:
+        answer_cache.set(cache_key, question_embedding, response, has_forecast=bool(request.context.weather_forecast))
+    return {**response, "cached": False}
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QueryRequest):
+    """
+    Streaming variant of /ask (Server-Sent Events). Emits, in order:
+      - `sources`:  the retrieved documents, before generation starts
+      - `token`:    each piece of the answer as the LLM produces it
+      - `sentence`: each completed sentence, so translation can start early
+      - `done`:     the full answer
+    An `error` event is sent if anything fails mid-stream.
+    """
+    if qa_chain is None:
+        raise HTTPException(
+            status_code=503, 
+            detail="Model is not ready or failed to load. Check server logs."
+        )
+
+    rich_prompt = construct_rich_prompt(request)
+    # Claim the slot before the response starts, so an overloaded server can still answer 503.
+    await acquire_slot()
+    cancel_event = threading.Event()
+    released = False
+
+    async def release_slot():
+        # Runs when the stream ends and again after the response, which also covers a
+        # client that disconnected before the stream started; only the first call counts.
+        nonlocal released
+        if not released:
+            released = True
+            cancel_event.set()
+            scheduler.release()
+
+    async def event_stream():
+        try:
+            with span("Retrieval", RETRIEVAL_SECONDS):
+                docs = await run_in_threadpool(retrieve_documents, request)
+            yield sse_event("sources", {"sources": format_sources(docs)})
+
+            prompt = build_generation_prompt(qa_chain, docs, rich_prompt)
+            answer, pending = "", ""
+            started, first_token = time.perf_counter(), True
+            async for token in iterate_in_threadpool(stream_answer_tokens(qa_chain, prompt, cancel_event)):
+                if first_token:
+                    record("First token", FIRST_TOKEN_SECONDS, time.perf_counter() - started)
+                    first_token = False
+                answer += token
+                pending += token
+                yield sse_event("token", {"text": token})
+                sentences, pending = split_complete_sentences(pending)
+                for sentence in sentences:
+                    yield sse_event("sentence", {"text": sentence})
+
+            if pending.strip():
+                yield sse_event("sentence", {"text": pending.strip()})
+            record("Generation", GENERATION_SECONDS, time.perf_counter() - started, "stream")
+            yield sse_event("done", {"answer": answer})
+        except asyncio.CancelledError:
+            # The client disconnected; stop pulling tokens from Ollama.
+            scheduler.cancelled += 1
+            raise
+        except Exception as e:
+            print(f"Streaming answer failed: {e}")
+            yield sse_event("error", {"detail": "Answer generation failed."})
+        finally:
+            await release_slot()
+
+    try:
+        return StreamingResponse(event_stream(), media_type="text/event-stream",
+                                 background=BackgroundTask(release_slot))
+    except Exception:
+        await release_slot()
+        raise
 
 if __name__ == "__main__":
     # To run this API:
@@ -0,0 +1,130 @@
+# context.py
+# Context assembly between retrieval and generation.
+# Retrieved chunks overlap (the splitter repeats 50 characters between
+# neighbours) and often repeat the same boilerplate, and prompt tokens dominate
+# local LLM latency. So before generation, chunks from the same page are merged,
+# near-duplicates are dropped, and the result is cut to a token budget;
+# optionally only the sentences relevant to the question are kept.
+
+import os
+import re
+
+from langchain_core.documents import Document
+
+# --- Configuration ---
+CONTEXT_COMPRESSION = os.environ.get("CONTEXT_COMPRESSION", "true").lower() == "true"
+# Rough budget for the retrieved context in the prompt (about 4/3 tokens per word).
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1200"))
+# Share of a chunk's word shingles found in a better-ranked chunk for it to count as a duplicate.
+CONTEXT_DUPLICATE_SIMILARITY = float(os.environ.get("CONTEXT_DUPLICATE_SIMILARITY", "0.8"))
+CONTEXT_EXTRACT_SENTENCES = os.environ.get("CONTEXT_EXTRACT_SENTENCES", "false").lower() == "true"
+
+MIN_OVERLAP_CHARS = 20
+SHINGLE_SIZE = 5
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s+")
+_WORD = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in", "is",
+    "it", "my", "of", "on", "or", "should", "the", "this", "to", "what", "when", "which", "with",
+}
+
+
+def estimate_tokens(text):
+    return (len(text.split()) * 4 + 2) // 3
+
+
+def _overlap(left, right):
+    """Length of the longest suffix of `left` that is a prefix of `right` (at least MIN_OVERLAP_CHARS)."""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_adjacent(docs):
+    """
+    Joins chunks from the same source page that overlap, in rank order of their
+    best-ranked piece. Chunks with `start_index` metadata are ordered by it;
+    otherwise overlaps are detected from the text itself.
+    """
+    merged = []
+    for doc in docs:
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        for i, existing in enumerate(merged):
+            if (existing.metadata.get("source"), existing.metadata.get("page")) != key:
+                continue
+            first, second = existing, doc
+            if doc.metadata.get("start_index", 0) < existing.metadata.get("start_index", 0):
+                first, second = doc, existing
+            overlap = _overlap(first.page_content, second.page_content)
+            if not overlap:
+                first, second = second, first
+                overlap = _overlap(first.page_content, second.page_content)
+            if overlap:
+                text = first.page_content + second.page_content[overlap:]
+                merged[i] = Document(id=existing.id, page_content=text, metadata=first.metadata)
+                break
+        else:
+            merged.append(doc)
+    return merged
+
+
+def _shingles(text):
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def drop_near_duplicates(docs, threshold=CONTEXT_DUPLICATE_SIMILARITY):
+    """
+    Keeps the best-ranked of any group of near-identical passages. Similarity is
+    measured against the smaller passage, so a chunk already contained in a
+    merged one is dropped too.
+    """
+    kept, kept_shingles = [], []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        duplicate = any(len(shingles & other) / min(len(shingles), len(other)) >= threshold
+                        for other in kept_shingles)
+        if not duplicate:
+            kept.append(doc)
+            kept_shingles.append(shingles)
+    return kept
+
+
+def extract_relevant_sentences(doc, question):
+    """Keeps only the sentences sharing a content word with the question (or the first one)."""
+    terms = {word for word in _WORD.findall(question.lower()) if word not in STOPWORDS}
+    sentences = [s for s in _SENTENCE_END.split(doc.page_content) if s.strip()]
+    relevant = [s for s in sentences if terms & set(_WORD.findall(s.lower()))] or sentences[:1]
+    return Document(id=doc.id, page_content=" ".join(relevant), metadata=doc.metadata)
+
+
+def fit_to_budget(docs, budget=CONTEXT_TOKEN_BUDGET):
+    """Keeps documents in rank order until the budget is spent; the last one is cut at a sentence."""
+    kept, used = [], 0
+    for doc in docs:
+        tokens = estimate_tokens(doc.page_content)
+        if used + tokens <= budget:
+            kept.append(doc)
+            used += tokens
+            continue
+        partial = ""
+        for sentence in _SENTENCE_END.split(doc.page_content):
+            candidate = f"{partial} {sentence}".strip()
+            if used + estimate_tokens(candidate) > budget:
+                break
+            partial = candidate
+        if partial:
+            kept.append(Document(id=doc.id, page_content=partial, metadata=doc.metadata))
+        break
+    return kept
+
+
+def compress_context(docs, question, budget=CONTEXT_TOKEN_BUDGET, extract_sentences=CONTEXT_EXTRACT_SENTENCES):
+    """Merges, de-duplicates and trims retrieved documents before they go into the prompt."""
+    docs = drop_near_duplicates(merge_adjacent(docs))
+    if extract_sentences:
+        docs = [extract_relevant_sentences(doc, question) for doc in docs]
+    return fit_to_budget(docs, budget)
@@ -0,0 +1,74 @@
+# embedding.py
+# Builds the embeddings model used to build and query the vector store.
+# The device is detected instead of assuming CUDA, and on CPU-only nodes the
+# model can run through ONNX Runtime (optionally int8-quantized), which is
+# several times faster than PyTorch there.
+
+import importlib.util
+import os
+
+from langchain_huggingface import HuggingFaceEmbeddings
+
+# --- Configuration ---
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+# "auto", "cuda", "mps" or "cpu".
+EMBEDDING_DEVICE = os.environ.get("EMBEDDING_DEVICE", "auto")
+# "auto" (ONNX on CPU when available, otherwise PyTorch), "torch" or "onnx".
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "auto")
+# ONNX export shipped in the model repo; the quint8 AVX2 file runs on any modern x86 CPU.
+EMBEDDING_ONNX_FILE = os.environ.get("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+# CPU threads per embedding call; 0 leaves the library default (all cores).
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "0"))
+
+
+def detect_device():
+    if EMBEDDING_DEVICE != "auto":
+        return EMBEDDING_DEVICE
+    import torch
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def onnx_available():
+    return importlib.util.find_spec("onnxruntime") is not None and importlib.util.find_spec("optimum") is not None
+
+
+def select_backend(device):
+    if EMBEDDING_BACKEND != "auto":
+        return EMBEDDING_BACKEND
+    return "onnx" if device == "cpu" and onnx_available() else "torch"
+
+
+def onnx_model_kwargs():
+    import onnxruntime
+    session_options = onnxruntime.SessionOptions()
+    if EMBEDDING_THREADS:
+        session_options.intra_op_num_threads = EMBEDDING_THREADS
+    return {
+        "file_name": EMBEDDING_ONNX_FILE,
+        "provider": "CPUExecutionProvider",
+        "session_options": session_options,
+    }
+
+
+def get_embeddings():
+    """The embeddings model used both to build the vector store and to query it."""
+    device = detect_device()
+    backend = select_backend(device)
+    model_kwargs = {'device': device}
+    if backend == "onnx":
+        model_kwargs.update(backend="onnx", model_kwargs=onnx_model_kwargs())
+    elif device == "cpu" and EMBEDDING_THREADS:
+        import torch
+        torch.set_num_threads(EMBEDDING_THREADS)
+
+    print(f"Initializing embeddings model on {device} ({backend} backend)...")
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs=model_kwargs,
+        encode_kwargs={'batch_size': EMBEDDING_BATCH_SIZE},
+    )
@@ -0,0 +1,155 @@
+# ingestion.py
+# Parallel, streaming ingestion of PDFs into the FAISS vector store.
+# PDFs are parsed and split in a pool of worker processes while the main process
+# embeds finished chunks in fixed-size batches and adds them to the index as it
+# goes, so only a bounded number of files and one batch of chunks are ever held
+# in memory, however large the corpus.
+
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from vector_store import train_index, training_size
+
+# --- Configuration ---
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_EMBED_BATCH_SIZE = int(os.environ.get("INGEST_EMBED_BATCH_SIZE", "256"))
+# PDFs parsed ahead of the embedder; bounds memory when embedding is the bottleneck.
+INGEST_MAX_PENDING_FILES = int(os.environ.get("INGEST_MAX_PENDING_FILES", str(2 * INGEST_WORKERS)))
+PROGRESS_EVERY_FILES = 10
+
+
+def load_and_split(path):
+    """Runs in a worker process: parses one PDF and splits it into chunks."""
+    pages = PyPDFLoader(path).load()
+    # start_index lets context assembly stitch neighbouring chunks back together.
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+    return splitter.split_documents(pages)
+
+
+class IngestionPipeline:
+    """
+    Adds PDFs to the FAISS store `db`. If its index still needs training (IVF/PQ),
+    vectors are held back until enough have been collected to train it.
+    """
+
+    def __init__(self, embeddings, db, workers=INGEST_WORKERS, batch_size=INGEST_EMBED_BATCH_SIZE,
+                 max_pending_files=INGEST_MAX_PENDING_FILES):
+        self.embeddings = embeddings
+        self.db = db
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.max_pending_files = max(self.workers, max_pending_files)
+        self._batch = []
+        self._untrained = []  # (ids, texts, vectors, metadatas) waiting for training
+        self._untrained_count = 0
+        # Docstore ids of the chunks added for each file, for the manifest.
+        self.ids_by_file = {}
+        # Stats
+        self.files_done = 0
+        self.failed_files = []
+        self.chunks_added = 0
+        self.embed_seconds = 0.0
+        self._started_at = None
+
+    def run(self, file_paths):
+        """Ingests `file_paths`; returns the paths that were added successfully."""
+        self._started_at = time.monotonic()
+        succeeded = []
+        paths = iter(file_paths)
+        print(f"Ingesting {len(file_paths)} document(s) with {self.workers} parser process(es)...")
+        # 'spawn' keeps CUDA state in this process out of the workers.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            pending = {}
+            while True:
+                while len(pending) < self.max_pending_files:
+                    path = next(paths, None)
+                    if path is None:
+                        break
+                    pending[pool.submit(load_and_split, path)] = path
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    try:
+                        chunks = future.result()
+                    except Exception as e:
+                        print(f"Skipping {path}: could not parse it ({e}).")
+                        self.failed_files.append(path)
+                        continue
+                    self._add_chunks(path, chunks)
+                    succeeded.append(path)
+                    self.files_done += 1
+                    if self.files_done % PROGRESS_EVERY_FILES == 0:
+                        self._print_progress(len(file_paths))
+
+        self._flush()
+        self._print_progress(len(file_paths))
+        return succeeded
+
+    def _add_chunks(self, path, chunks):
+        ids = [str(uuid.uuid4()) for _ in chunks]
+        self.ids_by_file[path] = ids
+        self._batch.extend(zip(ids, chunks))
+        while len(self._batch) >= self.batch_size:
+            batch, self._batch = self._batch[:self.batch_size], self._batch[self.batch_size:]
+            self._embed_and_add(batch)
+
+    def _flush(self):
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._embed_and_add(batch)
+        if self._untrained:
+            self._train_and_add()
+
+    def _embed_and_add(self, batch):
+        ids = [chunk_id for chunk_id, _ in batch]
+        texts = [chunk.page_content for _, chunk in batch]
+        metadatas = [chunk.metadata for _, chunk in batch]
+        started = time.monotonic()
+        vectors = self.embeddings.embed_documents(texts)
+        self.embed_seconds += time.monotonic() - started
+
+        if not self.db.index.is_trained:
+            self._untrained.append((ids, texts, vectors, metadatas))
+            self._untrained_count += len(batch)
+            if self._untrained_count >= training_size():
+                self._train_and_add()
+            return
+        self.db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        self.chunks_added += len(batch)
+
+    def _train_and_add(self):
+        held, self._untrained, self._untrained_count = self._untrained, [], 0
+        train_index(self.db, [vector for _, _, vectors, _ in held for vector in vectors])
+        for ids, texts, vectors, metadatas in held:
+            self.db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+            self.chunks_added += len(ids)
+
+    def _print_progress(self, total_files):
+        elapsed = max(time.monotonic() - self._started_at, 1e-9)
+        print(
+            f"Processed {self.files_done}/{total_files} documents, {self.chunks_added} chunks embedded "
+            f"({self.files_done / elapsed:.1f} docs/s, {self.chunks_added / elapsed:.1f} chunks/s, "
+            f"{self.embed_seconds:.1f}s embedding)."
+        )
+
+    def stats(self):
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "files_done": self.files_done,
+            "files_failed": len(self.failed_files),
+            "chunks_added": self.chunks_added,
+            "elapsed_seconds": elapsed,
+            "embed_seconds": self.embed_seconds,
+            "chunks_per_second": (self.chunks_added / elapsed) if elapsed else 0.0,
+        }
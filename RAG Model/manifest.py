@@ -0,0 +1,114 @@
+# manifest.py
+# Tracks which documents are in the vector store and which vectors belong to each.
+# Files are fingerprinted by size + mtime (cheap) and SHA-256 (only when size or
+# mtime changed), so an update re-embeds only documents whose content actually
+# changed and removes the vectors of documents that were deleted.
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+
+MANIFEST_FILE = "manifest.json"
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class ManifestDiff:
+    """Relative paths by status; fingerprints hold the stat + hash of each current file looked at."""
+    added: list = field(default_factory=list)
+    changed: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    touched: list = field(default_factory=list)  # New mtime, same content.
+    fingerprints: dict = field(default_factory=dict)
+
+    def has_changes(self):
+        return bool(self.added or self.changed or self.removed)
+
+
+class DocumentManifest:
+    """Maps each document (path relative to the data directory) to its fingerprint and docstore ids."""
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, db_path):
+        path = os.path.join(db_path, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["documents"])
+
+    def save(self, db_path):
+        """Writes the manifest with a temp file + os.replace, so readers never see half of it."""
+        path = os.path.join(db_path, MANIFEST_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self.entries}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_vectorstore(cls, db, data_path):
+        """
+        Rebuilds the manifest for a store built before manifests existed, by
+        grouping docstore ids on each chunk's `source` metadata.
+        """
+        entries = {}
+        for doc_id, doc in db.docstore._dict.items():
+            source = doc.metadata.get("source")
+            if source:
+                relpath = os.path.relpath(source, data_path)
+                entries.setdefault(relpath, {"ids": []})["ids"].append(doc_id)
+        manifest = cls(entries)
+        for relpath, entry in entries.items():
+            full_path = os.path.join(data_path, relpath)
+            if os.path.exists(full_path):
+                entry.update(manifest.fingerprint(full_path))
+        return manifest
+
+    @staticmethod
+    def fingerprint(path):
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": file_sha256(path)}
+
+    def diff(self, data_path, current_files):
+        """Compares the manifest with `current_files` (paths under `data_path`)."""
+        result = ManifestDiff()
+        current = {os.path.relpath(path, data_path): path for path in current_files}
+        for relpath, path in current.items():
+            entry = self.entries.get(relpath)
+            if entry is None:
+                result.added.append(relpath)
+                result.fingerprints[relpath] = self.fingerprint(path)
+                continue
+            stat = os.stat(path)
+            if stat.st_size == entry.get("size") and stat.st_mtime == entry.get("mtime"):
+                continue  # Fast path: no need to read the file.
+            fingerprint = self.fingerprint(path)
+            result.fingerprints[relpath] = fingerprint
+            if fingerprint["sha256"] == entry.get("sha256"):
+                result.touched.append(relpath)
+            else:
+                result.changed.append(relpath)
+        result.removed = [relpath for relpath in self.entries if relpath not in current]
+        return result
+
+    def record(self, relpath, fingerprint, ids):
+        self.entries[relpath] = {**fingerprint, "ids": list(ids)}
+
+    def remove(self, relpath):
+        """Forgets a document; returns the docstore ids its vectors had."""
+        entry = self.entries.pop(relpath, None)
+        return entry["ids"] if entry else []
+
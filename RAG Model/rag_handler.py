@@ -1,122 +1,115 @@
-# rag_handler.py (Ollama & GPU Enabled)
+# rag_handler.py (Ollama; embeddings on GPU or CPU)
 # This version uses a locally run Ollama model for fast, private, and free generation.
 
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-# from langchain_community.huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
-from langchain_community.document_loaders import PyPDFLoader
 import glob
 from langchain_community.llms import Ollama # Import the Ollama LLM
-from langchain_huggingface import HuggingFaceEmbeddings 
+from langchain_core.prompts import format_document
+from embedding import get_embeddings
+from ingestion import IngestionPipeline
+from manifest import DocumentManifest
+from vector_store import (create_vectorstore, delete_documents, discard_staging, load_vectorstore,
+                          recover_interrupted_save, save_vectorstore_atomically)
 
 
 # --- Configuration ---
 DATA_PATH = 'data/'
 DB_FAISS_PATH = 'vectorstore/db_faiss'
-PROCESSED_FILES_LOG = 'vectorstore/processed_files.log'
-EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
-
-def get_processed_files():
-    """Reads the log file and returns a set of processed filenames."""
-    if not os.path.exists(PROCESSED_FILES_LOG):
-        return set()
-    # --- FIX IS HERE ---
-    with open(PROCESSED_FILES_LOG, 'r', encoding='utf-8') as f:
-        return set(f.read().splitlines())
-
-def log_processed_files(filenames):
-    """Appends a list of newly processed filenames to the log."""
-    # --- FIX IS HERE ---
-    with open(PROCESSED_FILES_LOG, 'a', encoding='utf-8') as f:
-        for filename in filenames:
-            f.write(f"{filename}\n")
-
-def process_documents(file_paths):
-    """Loads, splits, and creates embeddings for a list of document paths."""
-    print(f"Processing {len(file_paths)} new document(s)...")
-    docs = []
-    count = 0
-    for path in file_paths:
-        count += 1
-        if count % 10 == 0:
-            print(f"Processed {count} documents so far...")
-        loader = PyPDFLoader(path)
-        docs.extend(loader.load())
-    
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    texts = text_splitter.split_documents(docs)
-    
-    print("Initializing embeddings model on GPU...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL_NAME,
-        model_kwargs={'device': 'cuda'}
-    )
-    
-    return texts, embeddings
+
+def list_documents():
+    return glob.glob(os.path.join(DATA_PATH, "**/*.pdf"), recursive=True)
+
+def ingest_into(db, manifest, embeddings, relpaths, fingerprints):
+    """Embeds the given documents and records their vector ids in the manifest."""
+    pipeline = IngestionPipeline(embeddings, db=db)
+    pipeline.run([os.path.join(DATA_PATH, relpath) for relpath in relpaths])
+    for path, ids in pipeline.ids_by_file.items():
+        relpath = os.path.relpath(path, DATA_PATH)
+        manifest.record(relpath, fingerprints[relpath], ids)
+    return pipeline.db
 
 def update_vector_db():
     """
-    Checks for new documents in the data path, processes them, 
-    and adds them to the existing FAISS database.
+    Brings the FAISS database in line with the data path: documents whose
+    content changed are re-embedded, deleted documents lose their vectors, and
+    new documents are added. Nothing is loaded if nothing changed.
     """
-    processed_files = get_processed_files()
-    all_files = set(glob.glob(os.path.join(DATA_PATH, "**/*.pdf"), recursive=True))
-    
-    all_files_relative = {os.path.relpath(f, DATA_PATH) for f in all_files}
-    new_files_relative = list(all_files_relative - processed_files)
+    recover_interrupted_save(DB_FAISS_PATH)
+    manifest = DocumentManifest.load(DB_FAISS_PATH)
+    embeddings, db = None, None
+    if manifest is None:
+        embeddings = get_embeddings()
+        print("No manifest found; building one from the existing vector store...")
+        db = load_vectorstore(DB_FAISS_PATH, embeddings, for_update=True)
+        manifest = DocumentManifest.from_vectorstore(db, DATA_PATH)
+
+    diff = manifest.diff(DATA_PATH, list_documents())
+    for relpath in diff.touched:
+        manifest.entries[relpath].update(diff.fingerprints[relpath])
 
-    if not new_files_relative:
+    if not diff.has_changes():
+        if diff.touched or db is not None:
+            manifest.save(DB_FAISS_PATH)
         print("No new documents to process. Database is up-to-date.")
         return
 
-    print(f"Found {len(new_files_relative)} new document(s) to add.")
-    
-    new_files_full_path = [os.path.join(DATA_PATH, f) for f in new_files_relative]
-    
-    new_texts, embeddings = process_documents(new_files_full_path)
-    
-    print("Loading existing vector store...")
-    db = FAISS.load_local(DB_FAISS_PATH, embeddings, allow_dangerous_deserialization=True)
-    
-    print("Adding new documents to the vector store...")
-    db.add_documents(new_texts)
-    
+    print(f"Found {len(diff.added)} new, {len(diff.changed)} changed and {len(diff.removed)} removed document(s).")
+    if db is None:
+        embeddings = get_embeddings()
+        print("Loading existing vector store...")
+        db = load_vectorstore(DB_FAISS_PATH, embeddings, for_update=True)
+
+    stale_ids = [doc_id for relpath in diff.changed + diff.removed for doc_id in manifest.remove(relpath)]
+    if stale_ids:
+        print(f"Removing {len(stale_ids)} outdated chunk(s) from the vector store...")
+        delete_documents(db, stale_ids)
+
+    print("Adding new and changed documents to the vector store...")
+    db = ingest_into(db, manifest, embeddings, diff.added + diff.changed, diff.fingerprints)
+
     print("Saving updated vector store...")
-    db.save_local(DB_FAISS_PATH)
-    
-    log_processed_files(new_files_relative)
+    save_vectorstore_atomically(db, manifest, DB_FAISS_PATH)
     print("Database update complete.")
 
 def create_vector_db():
     """Creates the initial vector database from all documents."""
-    all_files = glob.glob(os.path.join(DATA_PATH, "**/*.pdf"), recursive=True)
+    all_files = list_documents()
     if not all_files:
         print(f"No documents found in '{DATA_PATH}'. Please add PDF files.")
         return
 
-    texts, embeddings = process_documents(all_files)
-    
     print("Creating FAISS vector store...")
-    db = FAISS.from_documents(texts, embeddings)
-    db.save_local(DB_FAISS_PATH)
-    
-    print("Initial vector store created successfully.")
-    all_files_relative = [os.path.relpath(f, DATA_PATH) for f in all_files]
-    log_processed_files(all_files_relative)
+    embeddings = get_embeddings()
+    manifest = DocumentManifest()
+    relpaths = [os.path.relpath(f, DATA_PATH) for f in all_files]
+    fingerprints = {relpath: DocumentManifest.fingerprint(path) for relpath, path in zip(relpaths, all_files)}
+    db = create_vectorstore(embeddings, DB_FAISS_PATH)
+    saved = False
+    try:
+        db = ingest_into(db, manifest, embeddings, relpaths, fingerprints)
+        if db.index.ntotal == 0:
+            print("No text could be extracted from the documents; nothing was saved.")
+            return
+        save_vectorstore_atomically(db, manifest, DB_FAISS_PATH)
+        saved = True
+    finally:
+        if not saved:
+            # Don't leave a staging directory behind for the next run to trip over.
+            discard_staging(db, DB_FAISS_PATH)
+
     print(f"Initial vector store created and saved at {DB_FAISS_PATH}")
 
 # --- Setup function for the API ---
 def setup_qa_chain():
     """Sets up the QA chain for the API to use."""
     print("Setting up the QA chain...")
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME, model_kwargs={'device': 'cuda'})
+    embeddings = get_embeddings()
+    recover_interrupted_save(DB_FAISS_PATH)
     if not os.path.exists(DB_FAISS_PATH):
         print("Vector store not found. Please run the script to create it first.")
         return None
-    db = FAISS.load_local(DB_FAISS_PATH, embeddings, allow_dangerous_deserialization=True)
+    db = load_vectorstore(DB_FAISS_PATH, embeddings)
     retriever = db.as_retriever(search_kwargs={'k': 3})
     
     print("Initializing local LLM with Ollama...")
@@ -126,10 +119,56 @@ def setup_qa_chain():
     print("QA chain is ready.")
     return qa_chain
 
+def embed_text(qa_chain, text):
+    """Embeds `text` with the same model the vector store was built with."""
+    return qa_chain.retriever.vectorstore.embeddings.embed_query(text)
+
+# --- Streaming helpers for the API ---
+def build_generation_prompt(qa_chain, docs, question):
+    """
+    Fills the QA chain's 'stuff' prompt with the given documents, the same way
+    the chain does internally, so a streamed answer sees the exact same prompt.
+    """
+    combine_chain = qa_chain.combine_documents_chain
+    context = combine_chain.document_separator.join(
+        format_document(doc, combine_chain.document_prompt) for doc in docs
+    )
+    return combine_chain.llm_chain.prompt.format(
+        **{combine_chain.document_variable_name: context, "question": question}
+    )
+
+def stream_answer_tokens(qa_chain, prompt, cancel_event=None):
+    """
+    Yields the LLM's answer piece by piece as Ollama generates it.
+    Stops early once `cancel_event` is set; closing the stream closes the
+    connection to Ollama, which stops generating.
+    """
+    llm = qa_chain.combine_documents_chain.llm_chain.llm
+    stream = llm.stream(prompt)
+    try:
+        for token in stream:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            yield token
+    finally:
+        stream.close()
+
+def generate_answer(qa_chain, docs, question, cancel_event=None):
+    """
+    Answers `question` from the already-retrieved `docs`, like the QA chain's
+    'stuff' step. Generation is streamed internally so it can be abandoned when
+    `cancel_event` is set.
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        return ""
+    prompt = build_generation_prompt(qa_chain, docs, question)
+    return "".join(stream_answer_tokens(qa_chain, prompt, cancel_event))
+
 # --- Main Execution Block ---
 if __name__ == '__main__':
     os.makedirs('vectorstore', exist_ok=True)
     
+    recover_interrupted_save(DB_FAISS_PATH)
     if not os.path.exists(DB_FAISS_PATH):
         print("No existing database found. Creating a new one.")
         create_vector_db()
@@ -0,0 +1,131 @@
+# retrieval.py
+# Retrieval stage for the API.
+# Documents are retrieved with a short query (the farmer's question plus a few
+# crop/soil keywords) rather than the whole rich prompt; the context bullet list
+# only goes into the generation prompt. Query embeddings are cached because the
+# same seasonal questions are asked over and over.
+# Dense (FAISS) hits are fused with BM25 keyword hits, which catch exact pesticide
+# names, variety codes and dosages, using reciprocal rank fusion; a cross-encoder
+# can then rerank the fused candidates.
+
+import os
+import threading
+from collections import OrderedDict
+
+# --- Configuration ---
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", "3"))
+# Minimum relevance score (0-1) for a chunk to be used; 0 keeps the top k regardless.
+RETRIEVAL_SCORE_THRESHOLD = float(os.environ.get("RETRIEVAL_SCORE_THRESHOLD", "0"))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+HYBRID_RETRIEVAL = os.environ.get("HYBRID_RETRIEVAL", "true").lower() == "true"
+# Candidates taken from each retriever (and given to the reranker) before cutting to k.
+RETRIEVAL_CANDIDATES = int(os.environ.get("RETRIEVAL_CANDIDATES", "20"))
+RRF_K = 60
+# e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"; empty disables reranking.
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "")
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuses ranked lists of ids; an id scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def load_reranker(model_name=RERANK_MODEL):
+    if not model_name:
+        return None
+    from sentence_transformers import CrossEncoder
+    from embedding import detect_device
+    print(f"Loading reranker {model_name}...")
+    return CrossEncoder(model_name, device=detect_device())
+
+
+def build_retrieval_query(question, current_crop=None, soil_type=None):
+    """The question, plus crop and soil keywords it doesn't already mention."""
+    query = question.strip()
+    for keyword in (current_crop, soil_type):
+        if keyword and keyword.lower() not in query.lower():
+            query += f" {keyword}"
+    return query
+
+
+class QueryRetriever:
+    """
+    Hybrid search over a FAISS store: dense similarity (with an LRU of query
+    embeddings) fused with the docstore's BM25 keyword search when it has one,
+    optionally reranked by a cross-encoder.
+    """
+
+    def __init__(self, vectorstore, cache_size=QUERY_EMBEDDING_CACHE_SIZE, hybrid=HYBRID_RETRIEVAL,
+                 candidates=RETRIEVAL_CANDIDATES, reranker=None):
+        self.vectorstore = vectorstore
+        self.cache_size = cache_size
+        self.hybrid = hybrid and getattr(vectorstore.docstore, "supports_keyword_search", False)
+        self.candidates = candidates
+        self.reranker = reranker
+        self._embeddings = OrderedDict()
+        self._lock = threading.Lock()  # Searches run on several worker threads.
+        self._relevance = vectorstore._select_relevance_score_fn()
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    def embed_query(self, query):
+        key = " ".join(query.lower().split())
+        with self._lock:
+            embedding = self._embeddings.get(key)
+            if embedding is not None:
+                self._embeddings.move_to_end(key)
+                self.hits += 1
+                return embedding
+            self.misses += 1
+
+        embedding = self.vectorstore.embeddings.embed_query(query)
+        with self._lock:
+            self._embeddings[key] = embedding
+            while len(self._embeddings) > self.cache_size:
+                self._embeddings.popitem(last=False)
+        return embedding
+
+    def retrieve(self, query, k=RETRIEVAL_K, score_threshold=RETRIEVAL_SCORE_THRESHOLD):
+        """
+        Top `k` documents for `query`. `score_threshold` filters dense hits by
+        relevance score; keyword hits have no comparable score and always count.
+        """
+        widen = self.hybrid or self.reranker is not None
+        candidates = max(k, self.candidates) if widen else k
+        embedding = self.embed_query(query)
+        results = self.vectorstore.similarity_search_with_score_by_vector(embedding, k=candidates)
+        dense = [doc for doc, distance in results
+                 if not score_threshold or self._relevance(distance) >= score_threshold]
+        if not widen:
+            return dense
+
+        docs_by_id = {doc.id: doc for doc in dense}
+        rankings = [[doc.id for doc in dense]]
+        if self.hybrid:
+            keyword_ids = self.vectorstore.docstore.keyword_search(query, candidates)
+            for doc_id in keyword_ids:
+                if doc_id not in docs_by_id:
+                    docs_by_id[doc_id] = self.vectorstore.docstore.search(doc_id)
+            rankings.append(keyword_ids)
+        fused = [docs_by_id[doc_id] for doc_id in reciprocal_rank_fusion(rankings)]
+
+        if self.reranker is not None and fused:
+            scores = self.reranker.predict([(query, doc.page_content) for doc in fused])
+            fused = [doc for _, doc in sorted(zip(scores, fused), key=lambda pair: pair[0], reverse=True)]
+        return fused[:k]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "cached_embeddings": len(self._embeddings),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "hybrid": self.hybrid,
+            "reranker": RERANK_MODEL if self.reranker is not None else None,
+        }
@@ -0,0 +1,130 @@
+# scheduler.py
+# Admission control for the QA chain.
+# The chain is synchronous and the Ollama backend can only generate a few answers
+# at once, so requests run in worker threads under a concurrency cap, wait in a
+# bounded queue with a timeout, and are shed (503) when the queue is full.
+
+import asyncio
+import os
+import threading
+
+from starlette.concurrency import run_in_threadpool
+
+# --- Configuration ---
+# Match this to the Ollama server's OLLAMA_NUM_PARALLEL.
+RAG_MAX_CONCURRENCY = int(os.environ.get("RAG_MAX_CONCURRENCY", os.environ.get("OLLAMA_NUM_PARALLEL", "1")))
+RAG_MAX_QUEUE = int(os.environ.get("RAG_MAX_QUEUE", "16"))
+RAG_QUEUE_TIMEOUT = float(os.environ.get("RAG_QUEUE_TIMEOUT", "60"))
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+class SchedulerOverloaded(Exception):
+    """The wait queue is full; the request is shed immediately."""
+
+
+class SchedulerTimeout(Exception):
+    """The request waited longer than RAG_QUEUE_TIMEOUT for a free slot."""
+
+
+class ClientDisconnected(Exception):
+    """The client went away while its request was running; the work was cancelled."""
+
+
+class QAScheduler:
+    def __init__(self, max_concurrency=RAG_MAX_CONCURRENCY, max_queue=RAG_MAX_QUEUE, queue_timeout=RAG_QUEUE_TIMEOUT):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = None
+        # Metrics
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+
+    @property
+    def semaphore(self):
+        # Created lazily so it binds to the server's event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def acquire(self):
+        """Waits for a slot; raises SchedulerOverloaded / SchedulerTimeout instead of queueing forever."""
+        if self.running + self.waiting >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise SchedulerOverloaded()
+        self.waiting += 1
+        # Not wait_for: before Python 3.12 a timeout can race a successful acquire and lose the permit.
+        acquiring = asyncio.ensure_future(self.semaphore.acquire())
+        try:
+            done, _ = await asyncio.wait({acquiring}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(acquiring)
+            raise
+        finally:
+            self.waiting -= 1
+        if not done:
+            self._abandon(acquiring)
+            self.timed_out += 1
+            raise SchedulerTimeout()
+        self.running += 1
+
+    def _abandon(self, acquiring):
+        """Cancels a pending acquire; if it got the permit anyway, gives it back."""
+        def release_if_acquired(task):
+            if not task.cancelled() and task.exception() is None:
+                self.semaphore.release()
+        acquiring.cancel()
+        acquiring.add_done_callback(release_if_acquired)
+
+    def release(self):
+        self.running -= 1
+        self.completed += 1
+        self.semaphore.release()
+
+    async def run(self, job, request=None):
+        """
+        Runs `job(cancel_event)` in a worker thread; call it while holding a slot.
+        If `request` is given and its client disconnects, `cancel_event` is set so
+        the job can stop early (e.g. stop reading tokens from Ollama), and
+        ClientDisconnected is raised once it has.
+        """
+        cancel_event = threading.Event()
+        work = asyncio.ensure_future(run_in_threadpool(job, cancel_event))
+        if request is None:
+            return await work
+
+        watcher = asyncio.ensure_future(self._wait_for_disconnect(request))
+        try:
+            await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+        if work.done():
+            return work.result()
+
+        self.cancelled += 1
+        cancel_event.set()
+        # Wait for the thread to actually stop so the slot isn't freed while Ollama is still busy.
+        await asyncio.gather(work, return_exceptions=True)
+        raise ClientDisconnected()
+
+    @staticmethod
+    async def _wait_for_disconnect(request):
+        while not await request.is_disconnected():
+            await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+        }
@@ -0,0 +1,129 @@
+# semantic_cache.py
+# Semantic cache for /ask answers.
+# Farmers in the same district ask near-identical questions with the same
+# context, so an answer is reused when the new question's embedding is close
+# enough to a cached one *and* the context fields that change the advice match
+# exactly. Only the question is embedded: the context is shared boilerplate that
+# would make different questions about the same farm look alike.
+
+import os
+import time
+from collections import OrderedDict
+from itertools import count
+
+import numpy as np
+
+# --- Configuration ---
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity (MiniLM embeddings) above which two questions count as the same.
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+# Answers that depend on a weather forecast go stale with it.
+ANSWER_CACHE_FORECAST_TTL = float(os.environ.get("ANSWER_CACHE_FORECAST_TTL", str(3 * 3600)))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(24 * 3600)))
+
+
+def _normalize(value):
+    return " ".join(str(value).lower().split()) if value else ""
+
+
+def context_key(context):
+    """The context fields that must match exactly for an answer to be reused."""
+    return (
+        _normalize(context.location),
+        _normalize(context.soil_type),
+        _normalize(context.current_crop),
+        _normalize(context.weather_forecast),
+        _normalize(context.farm_size_acres),
+    )
+
+
+class SemanticAnswerCache:
+    """
+    Entries are grouped by `context_key`, so similarity is only ever compared
+    between questions with the same location, soil, crop, forecast and farm size. The cache is
+    LRU-bounded across all groups; `embedding` vectors are L2-normalised on the
+    way in so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_SIMILARITY, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 ttl=ANSWER_CACHE_TTL, forecast_ttl=ANSWER_CACHE_FORECAST_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.forecast_ttl = forecast_ttl
+        self._groups = {}              # context key -> {entry id: (vector, answer, expires_at)}
+        self._lru = OrderedDict()      # entry id -> context key
+        self._ids = count()
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.stores = 0
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, key, embedding):
+        """Returns the cached answer dict for the most similar question, or None."""
+        group = self._groups.get(key)
+        if group:
+            now = time.monotonic()
+            for entry_id in [entry_id for entry_id, entry in group.items() if entry[2] <= now]:
+                self._remove(entry_id)
+                self.expired += 1
+            group = self._groups.get(key)
+        if not group:
+            self.misses += 1
+            return None
+
+        entry_ids = list(group)
+        vectors = np.stack([group[entry_id][0] for entry_id in entry_ids])
+        similarities = vectors @ self._unit(embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._lru.move_to_end(entry_ids[best])
+        return group[entry_ids[best]][1]
+
+    def set(self, key, embedding, answer, has_forecast):
+        ttl = self.forecast_ttl if has_forecast else self.ttl
+        entry_id = next(self._ids)
+        self._groups.setdefault(key, {})[entry_id] = (self._unit(embedding), answer, time.monotonic() + ttl)
+        self._lru[entry_id] = key
+        self.stores += 1
+        while len(self._lru) > self.max_entries:
+            self._remove(next(iter(self._lru)))
+            self.evictions += 1
+
+    def _remove(self, entry_id):
+        key = self._lru.pop(entry_id)
+        group = self._groups[key]
+        del group[entry_id]
+        if not group:
+            del self._groups[key]
+
+    def clear(self):
+        self._groups.clear()
+        self._lru.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "context_groups": len(self._groups),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "stores": self.stores,
+            "similarity_threshold": self.threshold,
+        }
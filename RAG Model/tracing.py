@@ -0,0 +1,104 @@
+# tracing.py
+# Correlation IDs and Prometheus metrics for the RAG API.
+# Callers (the agentic core) pass an X-Correlation-ID header; it is echoed back
+# and printed with slow stages, so a slow answer can be matched to the chat turn
+# that asked for it. Queue wait, retrieval, generation and model load times are
+# exported as histograms at /metrics.
+
+import contextvars
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+
+# --- Configuration ---
+# Stages at least this slow are printed with their correlation ID.
+TRACE_SLOW_SPAN_MS = float(os.environ.get("TRACE_SLOW_SPAN_MS", "2000"))
+
+CORRELATION_HEADER = "X-Correlation-ID"
+_VALID_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "nandi_rag_queue_wait_seconds",
+    "Time a question waited for a generation slot.",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+RETRIEVAL_SECONDS = Histogram(
+    "nandi_rag_retrieval_seconds",
+    "Time to retrieve and compress the context documents.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+GENERATION_SECONDS = Histogram(
+    "nandi_rag_generation_seconds",
+    "Time the LLM took to produce an answer.",
+    ["endpoint"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+FIRST_TOKEN_SECONDS = Histogram(
+    "nandi_rag_first_token_seconds",
+    "Time from starting generation to the first streamed token.",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "nandi_rag_model_load_seconds",
+    "Time taken to load a model at startup.",
+    ["component"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+
+@contextmanager
+def span(name, histogram, *labels):
+    """Observes the block's duration on `histogram`; prints it if it was slow."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, histogram, time.perf_counter() - start, *labels)
+
+
+def record(name, histogram, seconds, *labels):
+    (histogram.labels(*labels) if labels else histogram).observe(seconds)
+    if seconds * 1000 >= TRACE_SLOW_SPAN_MS:
+        print(f"[{correlation_id.get()}] {name} took {seconds * 1000:.0f} ms")
+
+
+class CorrelationIdMiddleware:
+    """
+    Takes the caller's X-Correlation-ID (or makes one up) for the duration of
+    the request and returns it in the response headers. Plain ASGI, so
+    streamed answers pass straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        header = CORRELATION_HEADER.lower().encode("latin-1")
+        incoming = dict(scope["headers"]).get(header, b"").decode("latin-1")
+        request_id = incoming if _VALID_ID.match(incoming) else uuid.uuid4().hex[:16]
+        token = correlation_id.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            correlation_id.reset(token)
+
+
+def metrics_response():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,300 @@
+# vector_store.py
+# On-disk layout and index types for the FAISS vector store.
+# A store directory holds:
+#   index.faiss      - the FAISS index (flat, IVF, HNSW or PQ), memory-mapped when served
+#   docstore.sqlite  - chunk text + metadata, read one row per search hit, plus an
+#                      FTS5 (BM25) keyword index over the same chunks
+#   store.json       - the index class and the position -> docstore id mapping
+#   manifest.json    - see manifest.py
+# Several API replicas on one host then share the index pages through the page
+# cache, and nothing loads every chunk's text up front.
+
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+# --- Configuration ---
+# "flat" (exact), "ivf", "hnsw", "ivfpq" or "pq".
+FAISS_INDEX_TYPE = os.environ.get("FAISS_INDEX_TYPE", "flat")
+FAISS_NLIST = int(os.environ.get("FAISS_NLIST", "1024"))          # IVF centroids
+FAISS_HNSW_M = int(os.environ.get("FAISS_HNSW_M", "32"))          # HNSW graph degree
+FAISS_PQ_M = int(os.environ.get("FAISS_PQ_M", "48"))              # PQ sub-quantizers; must divide the dimension
+FAISS_NPROBE = int(os.environ.get("FAISS_NPROBE", "16"))          # IVF lists searched per query
+FAISS_EF_SEARCH = int(os.environ.get("FAISS_EF_SEARCH", "64"))    # HNSW search breadth
+# Memory-map the index when serving instead of reading it into RAM.
+FAISS_MMAP = os.environ.get("FAISS_MMAP", "true").lower() == "true"
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+STORE_FILE = "store.json"
+LEGACY_PICKLE_FILE = "index.pkl"
+
+# faiss wants ~39 training points per centroid; PQ codebooks have 256 centroids each.
+TRAINING_POINTS_PER_CENTROID = 39
+PQ_CENTROIDS = 256
+
+
+def index_description(index_type=FAISS_INDEX_TYPE, nlist=FAISS_NLIST):
+    """faiss.index_factory string for a configured index type."""
+    descriptions = {
+        "flat": "Flat",
+        "ivf": f"IVF{nlist},Flat",
+        "hnsw": f"HNSW{FAISS_HNSW_M}",
+        "ivfpq": f"IVF{nlist},PQ{FAISS_PQ_M}",
+        "pq": f"PQ{FAISS_PQ_M}",
+    }
+    if index_type not in descriptions:
+        raise ValueError(f"Unknown FAISS_INDEX_TYPE '{index_type}'; expected one of {sorted(descriptions)}.")
+    return descriptions[index_type]
+
+
+def training_size(index_type=FAISS_INDEX_TYPE):
+    """Vectors to collect before training; 0 if the index type needs no training."""
+    size = 0
+    if index_type in ("ivf", "ivfpq"):
+        size = FAISS_NLIST * TRAINING_POINTS_PER_CENTROID
+    if index_type in ("ivfpq", "pq"):
+        size = max(size, PQ_CENTROIDS * TRAINING_POINTS_PER_CENTROID)
+    return size
+
+
+def tune_for_search(index):
+    """Applies the query-time knobs (nprobe / efSearch) the index type supports."""
+    params = faiss.ParameterSpace()
+    if faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", FAISS_NPROBE)
+    if isinstance(index, faiss.IndexHNSW):
+        params.set_index_parameter(index, "efSearch", FAISS_EF_SEARCH)
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Docstore backed by SQLite, so chunk text is only read for the hits of a
+    search. An FTS5 table over the same chunks serves BM25 keyword search.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+                )
+                if not self._has_keyword_index():
+                    self._create_keyword_index()
+        self.supports_keyword_search = self._has_keyword_index()
+        self._lock = threading.Lock()  # Searches run on several worker threads.
+
+    def _create_keyword_index(self):
+        # External-content FTS5 table over `chunks`, kept in sync by triggers; the
+        # rebuild also backfills stores created before the keyword index existed.
+        self._conn.executescript("""
+            CREATE VIRTUAL TABLE chunks_fts USING fts5(text, content='chunks', content_rowid='rowid');
+            CREATE TRIGGER chunks_ai AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, text) VALUES (new.rowid, new.text);
+            END;
+            CREATE TRIGGER chunks_ad AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+            END;
+            INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild');
+        """)
+
+    def _has_keyword_index(self):
+        return self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_fts'"
+        ).fetchone() is not None
+
+    def search(self, search):
+        with self._lock:
+            row = self._conn.execute("SELECT text, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def keyword_search(self, query, k):
+        """Ids of the `k` chunks ranking best for `query` under BM25."""
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        # Quoted terms OR-ed together, so punctuation in the question can't break the FTS syntax.
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunks.id FROM chunks_fts JOIN chunks ON chunks.rowid = chunks_fts.rowid "
+                "WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts) LIMIT ?", (match, k)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def add(self, texts):
+        rows = [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()]
+        with self._lock, self._conn:
+            # Delete + insert rather than REPLACE, so the FTS triggers see the old row go.
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(row[0],) for row in rows])
+            self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?)", rows)
+
+    def delete(self, ids):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(doc_id,) for doc_id in ids])
+
+    def close(self):
+        self._conn.close()
+
+
+def staging_path(db_path):
+    return f"{db_path}.tmp"
+
+
+def new_staging_dir(db_path):
+    path = staging_path(db_path)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+def discard_staging(db, db_path):
+    """Closes a staged store that won't be published and removes its staging directory."""
+    if isinstance(db.docstore, SQLiteDocstore):
+        db.docstore.close()
+    shutil.rmtree(staging_path(db_path), ignore_errors=True)
+
+
+def create_vectorstore(embeddings, db_path, index_type=FAISS_INDEX_TYPE):
+    """
+    An empty store in the staging directory, to be filled by the ingestion
+    pipeline and published with `save_vectorstore_atomically`.
+    """
+    staging = new_staging_dir(db_path)
+    dimension = len(embeddings.embed_query("dimension probe"))
+    index = faiss.index_factory(dimension, index_description(index_type))
+    docstore = SQLiteDocstore(os.path.join(staging, DOCSTORE_FILE))
+    return FAISS(embeddings, index, docstore, {})
+
+
+def train_index(db, vectors, index_type=FAISS_INDEX_TYPE):
+    """
+    Trains an IVF/PQ index on `vectors`. Small corpora get fewer IVF centroids,
+    or a flat index if there is too little data to train PQ codebooks at all.
+    """
+    count = len(vectors)
+    dimension = db.index.d
+    if index_type in ("ivfpq", "pq") and count < PQ_CENTROIDS:
+        print(f"Only {count} vectors; too few to train PQ, using a flat index instead.")
+        db.index = faiss.index_factory(dimension, "Flat")
+        return
+    if index_type in ("ivf", "ivfpq") and count < FAISS_NLIST * TRAINING_POINTS_PER_CENTROID:
+        nlist = max(1, count // TRAINING_POINTS_PER_CENTROID)
+        print(f"Only {count} vectors; training IVF with {nlist} centroids instead of {FAISS_NLIST}.")
+        db.index = faiss.index_factory(dimension, index_description(index_type, nlist))
+    print(f"Training the {index_type} index on {count} vectors...")
+    db.index.train(np.asarray(vectors, dtype=np.float32))
+
+
+def delete_documents(db, ids):
+    """
+    Removes chunks from the store. Only flat and PQ indexes compact their ids
+    on removal, which is what the id mapping expects; IVF keeps the old ids and
+    HNSW can't remove points at all, so for those the index is rebuilt from the
+    remaining (reconstructed) vectors.
+    """
+    index = faiss.downcast_index(db.index)
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexPQ)):
+        db.delete(ids)
+        return
+    print(f"Rebuilding the {type(index).__name__} index without the deleted chunks...")
+    to_delete = set(ids)
+    kept = [(position, doc_id) for position, doc_id in sorted(db.index_to_docstore_id.items())
+            if doc_id not in to_delete]
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()  # reconstruct_n needs it to find vectors by id.
+    vectors = index.reconstruct_n(0, index.ntotal)
+    rebuilt = faiss.clone_index(index)
+    rebuilt.reset()
+    rebuilt.add(vectors[[position for position, _ in kept]])
+    db.index = rebuilt
+    db.docstore.delete(ids)
+    db.index_to_docstore_id = {i: doc_id for i, (_, doc_id) in enumerate(kept)}
+
+
+def load_vectorstore(db_path, embeddings, for_update=False, mmap=FAISS_MMAP):
+    """
+    Loads a store for serving (read-only, index memory-mapped when `mmap`) or,
+    with `for_update`, for the update script: the docstore is then copied to the
+    staging directory and modified there, so the live store stays intact until
+    the update is published.
+    """
+    if os.path.exists(os.path.join(db_path, LEGACY_PICKLE_FILE)):
+        # Stores built before this layout; converted on their next save.
+        db = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
+        if for_update:
+            new_staging_dir(db_path)
+        tune_for_search(db.index)
+        return db
+
+    with open(os.path.join(db_path, STORE_FILE), "r", encoding="utf-8") as f:
+        store = json.load(f)
+    index_to_docstore_id = {i: doc_id for i, doc_id in enumerate(store["ids"])}
+    docstore_path = os.path.join(db_path, DOCSTORE_FILE)
+
+    if for_update:
+        index = faiss.read_index(os.path.join(db_path, INDEX_FILE))
+        staged_docstore = os.path.join(new_staging_dir(db_path), DOCSTORE_FILE)
+        with sqlite3.connect(docstore_path) as source, sqlite3.connect(staged_docstore) as target:
+            source.backup(target)
+        docstore = SQLiteDocstore(staged_docstore)
+    else:
+        flags = (faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY) if mmap else 0
+        index = faiss.read_index(os.path.join(db_path, INDEX_FILE), flags)
+        docstore = SQLiteDocstore(docstore_path, read_only=True)
+
+    tune_for_search(index)
+    print(f"Loaded {index.ntotal} vectors ({store['index_class']}, mmap={mmap and not for_update}).")
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def save_vectorstore_atomically(db, manifest, db_path):
+    """
+    Writes the index, id mapping and manifest next to the staged docstore and
+    swaps the staging directory in for `db_path`, so a crash mid-save never
+    leaves a half-written store or an index and manifest that disagree.
+    """
+    staging = staging_path(db_path)
+    if not isinstance(db.docstore, SQLiteDocstore):
+        # Legacy in-memory docstore: move its chunks into SQLite.
+        docstore = SQLiteDocstore(os.path.join(staging, DOCSTORE_FILE))
+        docstore.add(db.docstore._dict)
+        db.docstore = docstore
+    db.docstore.close()
+
+    faiss.write_index(db.index, os.path.join(staging, INDEX_FILE))
+    ids = [db.index_to_docstore_id[i] for i in range(len(db.index_to_docstore_id))]
+    with open(os.path.join(staging, STORE_FILE), "w", encoding="utf-8") as f:
+        json.dump({"index_class": type(db.index).__name__, "ids": ids}, f)
+    manifest.save(staging)
+
+    old_path = f"{db_path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(db_path):
+        os.replace(db_path, old_path)
+    os.replace(staging, db_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def recover_interrupted_save(db_path):
+    """Puts the previous store back if a save was interrupted between the two renames."""
+    old_path = f"{db_path}.old"
+    if not os.path.exists(db_path) and os.path.exists(old_path):
+        print("Recovering the vector store from an interrupted save...")
+        os.replace(old_path, db_path)